@@ -10,9 +10,16 @@ from manifest     import *
 from whitelist    import *
 from certificate  import *
 from repository   import *
+from replication  import Replicator
+from revision_walker import MultiRevisionWalker
 from availability import *
 from _common      import _split_md5
 from _common      import _combine_md5
+from path_hasher  import PathHasher
+from path_index   import PathIndex
+from content_index import ContentIndex, ContentReference
+from dirent       import DirectoryEntryFilter
+from catalog      import PathNotFoundInCatalog
 
 import subprocess
 import re
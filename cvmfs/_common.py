@@ -5,10 +5,15 @@ Created by René Meusel
 This file is part of the CernVM File System auxiliary tools.
 """
 
-import ctypes
+import binascii
+import calendar
+import datetime
 import sqlite3
+import struct
 import subprocess
 import os
+import time
+import urllib
 
 
 _REPO_CONFIG_PATH      = "/etc/cvmfs/repositories.d"
@@ -21,6 +26,12 @@ _WHITELIST_NAME        = ".cvmfswhitelist"
 _LAST_REPLICATION_NAME = ".cvmfs_last_snapshot"
 _REPLICATING_NAME      = ".cvmfs_is_snapshotting"
 
+_MEMORY_BACKED_DIR     = "/dev/shm"
+
+# paths are arbitrary byte strings, latin-1 maps each byte to a single code
+# point and hence they survive a round trip through JSON
+_PATH_ENCODING         = "latin-1"
+
 
 class CvmfsNotInstalled(Exception):
     def __init__(self):
@@ -28,21 +39,98 @@ class CvmfsNotInstalled(Exception):
 
 
 class DatabaseObject:
-    _db_handle = None
+    """ Base class for the SQLite databases (catalogs, history) of a repository
+
+    Databases in the content addressable storage never change once they are
+    written. Hence they are opened read-only and immutable (no locking and no
+    journal checks) by default. The following class members are tuning knobs
+    for the sqlite connection and can be adjusted either here (affects all
+    databases) or on a subclass (i.e. Catalog or History) before opening.
+    """
+    _db_handle      = None
+    _active_cursors = 0     # number of iterate_sql() generators in progress
+    _close_pending  = False # close() was deferred until they are finished
+    on_reopen       = None  # called with the object when handles are reopened
+
+    immutable    = True              # read-only, skip locking and journal
+    shared_cache = False             # share the page cache among connections
+    mmap_size    = 256 * 1024 * 1024 # bytes to serve from memory mapped pages
+    cache_size   = -8192             # pages (or KiB if negative) to cache
+    temp_store   = "MEMORY"          # DEFAULT, FILE or MEMORY
 
     def __init__(self, db_file):
         self._file = db_file
         self._open_database()
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        """ Release the database handle (reopened transparently when used)
+
+        While result rows are still streamed by iterate_sql() the handle is
+        released only once the last of those queries is finished.
+        """
+        if self._active_cursors > 0:
+            self._close_pending = True
+            return
+        self._close_pending = False
         if self._db_handle:
             self._db_handle.close()
+            self._db_handle = None
         self._file.close()
 
+    def is_open(self):
+        return self._db_handle is not None
+
+    def has_active_cursors(self):
+        return self._active_cursors > 0
+
+    def is_memory_backed(self):
+        """ memory backed databases vanish once closed and cannot be reopened """
+        return False
+
     def _open_database(self):
         """ Create and configure a database handle to the Catalog """
-        self._db_handle = sqlite3.connect(self._file.name)
+        self._db_handle = self._connect()
         self._db_handle.text_factory = str
+        self._configure_database()
+
+    def _get_db_handle(self):
+        if self._db_handle is None:
+            self._open_database()
+            if self.on_reopen is not None:
+                self.on_reopen(self)
+        return self._db_handle
+
+    def _connect(self):
+        """ Connect via an sqlite URI to open the database immutable """
+        db_path = os.path.abspath(self._file.name)
+        if not os.path.isfile(db_path):
+            # sqlite would silently create an empty database instead
+            raise sqlite3.OperationalError("unable to open database file " +
+                                           db_path)
+        if self.shared_cache:
+            sqlite3.enable_shared_cache(True)
+        if not self.immutable:
+            return sqlite3.connect(db_path)
+        db_uri = "file:" + urllib.quote(db_path) + "?mode=ro&immutable=1"
+        if self.shared_cache:
+            db_uri += "&cache=shared"
+        try:
+            return sqlite3.connect(db_uri)
+        except sqlite3.OperationalError:
+            # the linked sqlite library doesn't interpret URI file names
+            db_handle = sqlite3.connect(db_path)
+            db_handle.execute("PRAGMA query_only = ON;")
+            return db_handle
+
+    def _configure_database(self):
+        cursor = self._db_handle.cursor()
+        cursor.execute("PRAGMA mmap_size = "  + str(int(self.mmap_size))  + ";")
+        cursor.execute("PRAGMA cache_size = " + str(int(self.cache_size)) + ";")
+        cursor.execute("PRAGMA temp_store = " + self.temp_store           + ";")
+        cursor.close()
 
     def db_size(self):
         return os.path.getsize(self._file.name)
@@ -55,14 +143,32 @@ class DatabaseObject:
             prop_value = prop[1]
             reader(prop_key, prop_value)
 
-    def run_sql(self, sql):
+    def run_sql(self, sql, parameters = ()):
         """ Run an arbitrary SQL query on the catalog database """
-        cursor = self._db_handle.cursor()
-        cursor.execute(sql)
+        cursor = self._get_db_handle().cursor()
+        cursor.execute(sql, parameters)
         data = cursor.fetchall()
         cursor.close()
         return data
 
+    def iterate_sql(self, sql, parameters = (), batch_size = 4096):
+        """ Run an arbitrary SQL query and lazily yield the result rows """
+        cursor = self._get_db_handle().cursor()
+        self._active_cursors += 1
+        try:
+            cursor.execute(sql, parameters)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+            self._active_cursors -= 1
+            if self._close_pending and self._active_cursors == 0:
+                self.close()
+
     def open_interactive(self):
         """ Spawns a sqlite shell for interactive catalog database inspection """
         subprocess.call(['sqlite3', self._file.name])
@@ -70,26 +176,39 @@ class DatabaseObject:
 
 
 def _binary_buffer_to_hex_string(binbuf):
-    return "".join(map(lambda c: ("%0.2X" % c).lower(),map(ord,binbuf)))
+    return binascii.hexlify(binbuf)
+
+_md5_signed_struct   = struct.Struct('<qq')
+_md5_unsigned_struct = struct.Struct('<QQ')
+_uint64_mask         = 0xFFFFFFFFFFFFFFFF
 
 def _split_md5(md5digest):
-    hi = lo = 0
-    for i in range(0, 8):
-        lo |= (ord(md5digest[i]) << (i * 8))
-    for i in range(8,16):
-        hi |= (ord(md5digest[i]) << ((i - 8) * 8))
-    return ctypes.c_int64(lo).value, ctypes.c_int64(hi).value  # signed int!
+    """ split an MD5 digest into two little-endian signed 64 bit integers """
+    return _md5_signed_struct.unpack(md5digest)
+
+def _split_md5_many(md5digests):
+    """ split a list of MD5 digests with a single unpack of all of them """
+    if not md5digests:
+        return []
+    halves = struct.unpack('<' + str(2 * len(md5digests)) + 'q',
+                           ''.join(md5digests))
+    return zip(halves[0::2], halves[1::2])
 
 def _combine_md5(lo, hi):
-    md5digest = [ '\x00','\x00','\x00','\x00','\x00','\x00','\x00','\x00',
-                  '\x00','\x00','\x00','\x00','\x00','\x00','\x00','\x00' ]
-    for i in range(0, 8):
-        md5digest[i] = chr(lo & 0xFF)
-        lo >>= 8
-    for i in range(8,16):
-        md5digest[i] = chr(hi & 0xFF)
-        hi >>= 8
-    return ''.join(md5digest)
+    return _md5_unsigned_struct.pack(lo & _uint64_mask, hi & _uint64_mask)
+
+def _canonicalize_path(path):
+    if not path:
+        return ""
+    return os.path.abspath(path)
+
+def _to_unix_timestamp(value):
+    """ UNIX timestamp of a datetime (naive ones are local time) or a number """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            return int(time.mktime(value.timetuple()))
+        return calendar.timegm(value.utctimetuple())
+    return int(value)
 
 
 class TzInfos:
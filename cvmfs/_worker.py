@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+State of multiprocessing worker processes that operate on a Repository. The
+Repository object is inherited from the parent process when the pool forks.
+"""
+
+import itertools
+import multiprocessing
+import Queue
+
+repository = None
+arguments  = ()
+results    = None
+
+def init(results_queue, worker_repository, *worker_arguments):
+    """ Pool initializer: detach inherited sqlite handles and store the state """
+    global repository, arguments, results
+    worker_repository._detach_opened_catalogs()
+    repository = worker_repository
+    arguments  = worker_arguments
+    results    = results_queue
+
+
+def schedule(tasks):
+    """ Hands follow-up tasks of the running task to the parent process """
+    if tasks:
+        results.put(('tasks', tasks))
+
+
+def emit(result):
+    """ Sends a (partial) result of the running task to the parent process """
+    results.put(('result', result))
+
+
+def _run_task(function, task_id, task):
+    function(task)
+    results.put(('done', task_id))
+
+
+def imap_tree(processes, worker_repository, function, tasks,
+              worker_arguments = (), poll_interval = 1.0, max_queued = 64):
+    """ Applies function to tasks and all follow-up tasks in a process pool
+
+    function(task) runs in a worker and reports through schedule() and
+    emit(). Follow-up tasks are started as soon as they are handed over and
+    results are yielded as they arrive. At most max_queued messages wait for
+    the parent, i.e. workers are throttled by a slow consumer. The pool
+    doesn't report failed tasks by itself, they are detected every
+    poll_interval seconds and their exception is raised here.
+    """
+    results_queue = multiprocessing.Queue(max_queued)
+    pool = multiprocessing.Pool(processes, init,
+                                (results_queue, worker_repository) +
+                                tuple(worker_arguments))
+    scheduled = {}
+    task_ids  = itertools.count()
+
+    def submit(task):
+        task_id = next(task_ids)
+        scheduled[task_id] = pool.apply_async(_run_task,
+                                              (function, task_id, task))
+
+    try:
+        for task in tasks:
+            submit(task)
+        while scheduled:
+            try:
+                kind, value = results_queue.get(True, poll_interval)
+            except Queue.Empty:
+                for async_result in scheduled.values():
+                    if async_result.ready() and not async_result.successful():
+                        async_result.get() # raises the task's exception
+                continue
+            if kind == 'result':
+                yield value
+            elif kind == 'tasks':
+                for task in value:
+                    submit(task)
+            else:
+                del scheduled[value]
+    finally:
+        pool.terminate()
+        pool.join()
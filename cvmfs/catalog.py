@@ -7,24 +7,51 @@ This file is part of the CernVM File System auxiliary tools.
 
 import datetime
 import collections
-import hashlib
-import os
+import tempfile
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from _common import _split_md5, _canonicalize_path, DatabaseObject
+from _common import _MEMORY_BACKED_DIR
+from path_hasher import default_path_hasher
+from dirent  import DirectoryEntry, Chunk, _Flags
+from catalog_diff import CatalogDiff
+
+
+class PathNotFoundInCatalog(Exception):
+    def __init__(self, catalog, path):
+        self.catalog = catalog
+        self.path    = path
+
+    def __str__(self):
+        return repr(self.path) + " not found in " + repr(self.catalog)
 
-from _common import _split_md5, DatabaseObject
-from dirent  import DirectoryEntry, Chunk
 
 
 class CatalogIterator:
     """ Iterates through all directory entries of a Catalog """
 
-    def __init__(self, catalog):
-        self.catalog = catalog
-        self.backlog = collections.deque()
-        root_path = ""
-        if not self.catalog.is_root():
-            root_path = self.catalog.root_prefix
-        self._push((root_path, self.catalog.find_directory_entry(root_path)))
+    def __init__(self, catalog, root_path = None, root_dirent = None,
+                       entry_filter = None, include_mountpoints = False):
+        """ Iterates the catalog's subtree starting at root_path (the catalog's
+            root by default) whose DirectoryEntry might be passed as well.
+            With a DirectoryEntryFilter only matching entries are returned but
+            all directories are still traversed """
+        self.catalog   = catalog
+        self.backlog   = collections.deque()
+        self.condition = None
+        if entry_filter is not None:
+            self.condition = entry_filter.sql_condition(include_mountpoints)
+        if root_path is None:
+            root_path = ""
+            if not self.catalog.is_root():
+                root_path = self.catalog.root_prefix
+        if root_dirent is None:
+            root_dirent = self.catalog.find_directory_entry(root_path)
+        self._push((root_path, root_dirent, self._root_matches(root_dirent)))
 
 
     def __iter__(self):
@@ -32,9 +59,27 @@ class CatalogIterator:
 
 
     def next(self):
-        if not self._has_more():
-            raise StopIteration()
-        return self._recursion_step()
+        while self._has_more():
+            path, dirent, matches = self._recursion_step()
+            if matches:
+                return path, dirent
+        raise StopIteration()
+
+
+    def get_backlog(self):
+        """ Compact iteration position: the (path, matches) pairs still to do """
+        return [ (path, matches) for path, _, matches in self.backlog ]
+
+
+    def restore_backlog(self, backlog):
+        """ Continue at a position previously obtained by get_backlog() """
+        paths   = [ path for path, _ in backlog ]
+        dirents = self.catalog.find_directory_entries(paths)
+        if None in dirents:
+            raise ValueError("Backlog doesn't match catalog " + self.catalog.hash)
+        self.backlog = collections.deque([ (path, dirent, matches)
+                                           for (path, matches), dirent
+                                           in zip(backlog, dirents) ])
 
 
     def _has_more(self):
@@ -49,14 +94,33 @@ class CatalogIterator:
         return self.backlog.popleft()
 
 
+    def _root_matches(self, root_dirent):
+        if self.condition is None:
+            return True
+        condition, parameters = self.condition
+        return self.catalog.matches_split_md5(root_dirent.md5path_1,
+                                              root_dirent.md5path_2,
+                                              condition, parameters)
+
+
+    def _list_directory(self, dirent):
+        if self.condition is None:
+            new_dirents = self.catalog.list_directory_split_md5(dirent.md5path_1,
+                                                                dirent.md5path_2)
+            return [ (new_dirent, True) for new_dirent in new_dirents ]
+        condition, parameters = self.condition
+        return self.catalog.list_directory_filtered_split_md5(dirent.md5path_1,
+                                                              dirent.md5path_2,
+                                                              condition,
+                                                              parameters)
+
+
     def _recursion_step(self):
-        path, dirent = self._pop()
+        path, dirent, matches = self._pop()
         if dirent.is_directory():
-            new_dirents = self.catalog.list_directory_split_md5(dirent.md5path_1, \
-                                                                dirent.md5path_2)
-            for new_dirent in new_dirents:
-                self._push((path + "/" + new_dirent.name, new_dirent))
-        return path, dirent
+            for new_dirent, new_matches in self._list_directory(dirent):
+                self._push((path + "/" + new_dirent.name, new_dirent, new_matches))
+        return path, dirent, matches
 
 
 
@@ -79,9 +143,49 @@ class CatalogReference:
 
 
 
+class NestedCatalogIndex:
+    """ Path component trie over the nested catalog mountpoints of a Catalog """
+
+    _reference = None # marks a trie node that is a nested catalog mountpoint
+
+    def __init__(self, nested_catalogs = ()):
+        self._root = {}
+        for nested_catalog in nested_catalogs:
+            self.add(nested_catalog)
+
+
+    def add(self, catalog_reference):
+        """ Insert a CatalogReference at the position of its mountpoint """
+        node = self._root
+        for component in self._split_path(catalog_reference.root_path):
+            node = node.setdefault(component, {})
+        node[self._reference] = catalog_reference
+
+
+    def find_longest_prefix(self, path):
+        """ Find the CatalogReference with the longest mountpoint prefix """
+        node       = self._root
+        best_match = node.get(self._reference)
+        for component in self._split_path(path):
+            node = node.get(component)
+            if node is None:
+                break
+            best_match = node.get(self._reference, best_match)
+        return best_match
+
+
+    @staticmethod
+    def _split_path(path):
+        return [ component for component in path.split('/') if component ]
+
+
+
 class CatalogStatistics:
     """ Provides a convenience data wrapper around catalog statistics """
 
+    counter_names = [ 'regular', 'dir', 'symlink', 'file_size', 'chunked',
+                      'chunked_size', 'chunks', 'nested' ]
+
     def __init__(self, catalog):
         self.catalog = catalog
         if catalog.schema >= 2.1:
@@ -129,6 +233,19 @@ class CatalogStatistics:
                self._get_stat('all_chunks')  , self._get_stat('all_nested')
 
 
+    def get_counters(self):
+        """ returns the counters of the catalog itself as a dictionary """
+        return dict([ (name, getattr(self, name))
+                      for name in CatalogStatistics.counter_names
+                      if hasattr(self, name) ])
+
+    def get_subtree_counters(self):
+        """ returns the counters including all nested catalogs as a dictionary """
+        return dict([ (name, getattr(self, 'all_' + name))
+                      for name in CatalogStatistics.counter_names
+                      if hasattr(self, 'all_' + name) ])
+
+
     def _read_statistics(self, catalog):
         stats = catalog.run_sql("SELECT * FROM statistics ORDER BY counter;")
         for stat, value in stats:
@@ -154,9 +271,26 @@ class Catalog(DatabaseObject):
         f = open(catalog_path)
         return Catalog(f)
 
+    @staticmethod
+    def from_buffer(content, catalog_hash = "", memory_dir = None):
+        """ Initializes a memory backed Catalog from decompressed content
+
+        Python's sqlite3 module cannot load a database from a buffer, hence
+        the content is placed in a temporary file in a memory backed file
+        system (/dev/shm by default) that is removed when the Catalog closes.
+        """
+        if memory_dir is None:
+            memory_dir = _MEMORY_BACKED_DIR
+        f = tempfile.NamedTemporaryFile(dir=memory_dir, prefix='catalog.')
+        f.write(content)
+        f.flush()
+        return MemoryBackedCatalog(f, catalog_hash)
+
     def __init__(self, catalog_file, catalog_hash = ""):
         DatabaseObject.__init__(self, catalog_file)
         self.hash = catalog_hash
+        self._nested_catalogs = None
+        self._nested_index    = None
         self._read_properties()
         self._guess_root_prefix_if_needed()
         self._guess_last_modified_if_needed()
@@ -187,16 +321,9 @@ class Catalog(DatabaseObject):
 
     def list_nested(self):
         """ List CatalogReferences to all contained nested catalogs """
-        new_version = (self.schema <= 1.2 and self.schema_revision > 0)
-        if new_version:
-            sql_query = "SELECT path, sha1, size FROM nested_catalogs;"
-        else:
-            sql_query = "SELECT path, sha1 FROM nested_catalogs;"
-        catalogs = self.run_sql(sql_query)
-        if new_version:
-            return [ CatalogReference(clg[0], clg[1], clg[2]) for clg in catalogs ]
-        else:
-            return [ CatalogReference(clg[0], clg[1]) for clg in catalogs ]
+        if self._nested_catalogs is None:
+            self._nested_catalogs = self._read_nested()
+        return list(self._nested_catalogs)
 
 
     def get_statistics(self):
@@ -206,22 +333,15 @@ class Catalog(DatabaseObject):
 
     def find_nested_for_path(self, needle_path):
         """ Find the best matching nested CatalogReference for a given path """
-        nested_catalogs  = self.list_nested()
-        best_match       = None
-        best_match_score = 0
+        if self._nested_index is None:
+            self._nested_index = NestedCatalogIndex(self.list_nested())
         real_needle_path = self._canonicalize_path(needle_path)
-        for nested_catalog in nested_catalogs:
-            if real_needle_path.startswith(nested_catalog.root_path) and \
-                len(nested_catalog.root_path) > best_match_score:
-                    best_match_score = len(nested_catalog.root_path)
-                    best_match       = nested_catalog
-        return best_match
+        return self._nested_index.find_longest_prefix(real_needle_path)
 
 
     def list_directory(self, path):
         """ Create a directory listing of the given directory path """
-        real_path = self._canonicalize_path(path)
-        parent_1, parent_2 = _split_md5(hashlib.md5(real_path).digest())
+        parent_1, parent_2 = default_path_hasher.split_md5(path)
         return self.list_directory_split_md5(parent_1, parent_2)
 
 
@@ -235,11 +355,49 @@ class Catalog(DatabaseObject):
         return [ self._make_directory_entry(result) for result in res ]
 
 
+    def list_directory_filtered_split_md5(self, parent_1, parent_2,
+                                                condition, parameters = ()):
+        """ Lists a directory's entries matching an SQL condition and all of
+            its subdirectories as (DirectoryEntry, matches) tuples """
+        res = self.run_sql("SELECT * FROM (                                      \
+                              SELECT " + DirectoryEntry.catalog_db_fields() + ", \
+                                     (" + condition + ") AS matches              \
+                              FROM catalog                                       \
+                              WHERE parent_1 = " + str(parent_1) + " AND         \
+                                    parent_2 = " + str(parent_2) + ")            \
+                            WHERE matches OR (flags & " + str(_Flags.Directory) + ") \
+                            ORDER BY name ASC;", parameters)
+        return [ (self._make_directory_entry(result[:-1]), bool(result[-1]))
+                 for result in res ]
+
+
+    def matches_split_md5(self, md5path_1, md5path_2, condition, parameters = ()):
+        """ Checks if the entry with the given MD5 path matches a condition """
+        res = self.run_sql("SELECT count(*) FROM catalog                       \
+                            WHERE md5path_1 = " + str(md5path_1) + " AND       \
+                                  md5path_2 = " + str(md5path_2) + " AND       \
+                                  (" + condition + ");", parameters)
+        return res[0][0] > 0
+
+
+    def find_entries(self, entry_filter, path = None):
+        """ Iterates (path, DirectoryEntry) pairs matching a DirectoryEntryFilter
+            below path (the catalog's root by default) """
+        root_dirent = None
+        if path is not None:
+            path = _canonicalize_path(path)
+            if path == "/":
+                path = ""
+            root_dirent = self.find_directory_entry(path)
+            if root_dirent is None:
+                raise PathNotFoundInCatalog(self, path)
+        return CatalogIterator(self, path, root_dirent, entry_filter)
+
+
     def find_directory_entry(self, path):
         """ Finds the DirectoryEntry for a given path """
-        real_path = self._canonicalize_path(path)
-        md5path = hashlib.md5(real_path)
-        return self.find_directory_entry_md5(md5path)
+        md5path_1, md5path_2 = default_path_hasher.split_md5(path)
+        return self.find_directory_entry_split_md5(md5path_1, md5path_2)
 
 
     def find_directory_entry_md5(self, md5path):
@@ -258,6 +416,96 @@ class Catalog(DatabaseObject):
         return self._make_directory_entry(res[0]) if len(res) == 1 else None
 
 
+    def find_path_split_md5(self, md5path_1, md5path_2):
+        """ Reconstructs the full path of an entry given by its split MD5 path
+            hash by following its parent directories up to the catalog root """
+        root_path = "" if self.is_root() else self.root_prefix
+        root_md5  = default_path_hasher.split_md5(root_path)
+        md5path   = (md5path_1, md5path_2)
+        names     = []
+        while md5path != root_md5:
+            res = self.run_sql("SELECT name, parent_1, parent_2 FROM catalog \
+                                WHERE md5path_1 = ? AND md5path_2 = ?;", md5path)
+            if len(res) != 1:
+                return None
+            name, parent_1, parent_2 = res[0]
+            names.append(name)
+            md5path = (parent_1, parent_2)
+        return "/".join([ root_path ] + names[::-1])
+
+
+    def find_directory_entries(self, paths):
+        """ Finds the DirectoryEntries for a list of paths (None if not found) """
+        md5paths = default_path_hasher.split_md5_many(paths)
+        return self.find_directory_entries_split_md5(md5paths)
+
+
+    def find_directory_entries_split_md5(self, md5paths, batch_size = 500):
+        """ Finds the DirectoryEntries for a list of split MD5 path hashes
+
+        All entries are looked up with one query per batch_size distinct hashes
+        and are returned in input order with None for paths not in the catalog
+        """
+        wanted     = set(md5paths)
+        md5paths_1 = list(set([ md5path_1 for md5path_1, _ in wanted ]))
+        dirents    = {}
+        for i in range(0, len(md5paths_1), batch_size):
+            batch = ",".join([ str(md5path_1)
+                               for md5path_1 in md5paths_1[i:i + batch_size] ])
+            res = self.run_sql("SELECT " + DirectoryEntry.catalog_db_fields() + " \
+                                FROM catalog                                       \
+                                WHERE md5path_1 IN (" + batch + ");")
+            for result in res:
+                md5path = (result[0], result[1])
+                if md5path in wanted:
+                    dirents[md5path] = self._make_directory_entry(result)
+        return [ dirents.get(md5path) for md5path in md5paths ]
+
+
+    def read_columns(self, batch_size = 65536):
+        """ Export the catalog table as a dictionary of NumPy arrays
+
+        Integer columns are returned as int64 arrays of the length N of the
+        catalog table: 'md5path' and 'parent' (N x 2 split MD5 path hashes),
+        'size', 'mtime', 'mode' and 'flags'. Entry names are concatenated into
+        'name_bytes' (uint8) with the name of row i found in the slice
+        name_bytes[name_offsets[i]:name_offsets[i + 1]].
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required for Catalog.read_columns()")
+        count        = self.run_sql("SELECT count(*) FROM catalog;")[0][0]
+        integers     = numpy.empty((count, 8), dtype=numpy.int64)
+        name_lengths = numpy.empty(count, dtype=numpy.int64)
+        names        = []
+        cursor = self._get_db_handle().cursor()
+        cursor.execute("SELECT md5path_1, md5path_2, parent_1, parent_2,    \
+                               IFNULL(size, 0), mtime, mode, flags, name    \
+                        FROM catalog;")
+        offset = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = zip(*rows)
+            end     = offset + len(rows)
+            integers[offset:end]     = numpy.array(columns[:8], numpy.int64).T
+            name_lengths[offset:end] = map(len, columns[8])
+            names.append("".join(columns[8]))
+            offset  = end
+        cursor.close()
+        name_offsets     = numpy.zeros(count + 1, dtype=numpy.int64)
+        name_offsets[1:] = numpy.cumsum(name_lengths)
+        return { 'md5path'      : integers[:, 0:2],
+                 'parent'       : integers[:, 2:4],
+                 'size'         : integers[:, 4],
+                 'mtime'        : integers[:, 5],
+                 'mode'         : integers[:, 6],
+                 'flags'        : integers[:, 7],
+                 'name_offsets' : name_offsets,
+                 'name_bytes'   : numpy.frombuffer("".join(names),
+                                                   dtype=numpy.uint8) }
+
+
     def is_root(self):
         """ Checks if this is the root catalog (based on the root prefix) """
         return self.root_prefix == "/"
@@ -273,6 +521,24 @@ class Catalog(DatabaseObject):
         return CatalogReference(self.root_prefix, self.previous_revision)
 
 
+    def diff(self, new_catalog):
+        """ Iterate the CatalogDifferences from this Catalog to new_catalog """
+        return CatalogDiff(self, new_catalog)
+
+
+    def _read_nested(self):
+        new_version = (self.schema <= 1.2 and self.schema_revision > 0)
+        if new_version:
+            sql_query = "SELECT path, sha1, size FROM nested_catalogs;"
+        else:
+            sql_query = "SELECT path, sha1 FROM nested_catalogs;"
+        catalogs = self.run_sql(sql_query)
+        if new_version:
+            return [ CatalogReference(clg[0], clg[1], clg[2]) for clg in catalogs ]
+        else:
+            return [ CatalogReference(clg[0], clg[1]) for clg in catalogs ]
+
+
     def _read_properties(self):
         self.read_properties_table(lambda prop_key, prop_value:
             self._read_property(prop_key, prop_value))
@@ -303,7 +569,7 @@ class Catalog(DatabaseObject):
 
     def _read_chunks(self, dirent):
         """ Finds and adds the file chunk of a DirectoryEntry """
-        if self.schema < 2.4:
+        if self.schema < 2.4 or not dirent.is_chunked_file():
             return
         res = self.run_sql("SELECT " + Chunk.catalog_db_fields() + "            \
                             FROM chunks                                         \
@@ -327,9 +593,7 @@ class Catalog(DatabaseObject):
 
     @staticmethod
     def _canonicalize_path(path):
-        if not path:
-            return ""
-        return os.path.abspath(path)
+        return _canonicalize_path(path)
 
 
     def _check_validity(self):
@@ -344,3 +608,9 @@ class Catalog(DatabaseObject):
             raise Exception("Catalog lacks a last modification entry")
 
 
+
+class MemoryBackedCatalog(Catalog):
+    """ A Catalog whose database file only lives in memory (see from_buffer) """
+
+    def is_memory_backed(self):
+        return True
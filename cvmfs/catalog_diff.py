@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Computes the differences between two revisions of a catalog in a single pass.
+Both catalog tables are streamed ordered by their primary key (the split MD5
+path hash) and merge-joined, hence memory consumption is constant.
+
+Two repository revisions are compared like Merkle trees: nested catalogs with
+an unchanged content hash are identical including their entire subtree and
+are skipped without being opened.
+"""
+
+import collections
+
+from dirent import DirectoryEntry
+
+
+class CatalogDifference:
+    """ A single added, removed or modified directory entry """
+
+    Added    = "added"
+    Removed  = "removed"
+    Modified = "modified"
+
+    def __init__(self, action, old_dirent, new_dirent, changed_fields = ()):
+        self.action         = action
+        self.old_dirent     = old_dirent
+        self.new_dirent     = new_dirent
+        self.changed_fields = changed_fields
+
+    def __str__(self):
+        return "<CatalogDifference " + self.action + " '" + \
+               self.get_dirent().name + "'>"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get_dirent(self):
+        """ the most recent revision of the affected directory entry """
+        return self.new_dirent if self.new_dirent else self.old_dirent
+
+    def path_hash(self):
+        return self.get_dirent().path_hash()
+
+    def is_added(self):
+        return self.action == CatalogDifference.Added
+
+    def is_removed(self):
+        return self.action == CatalogDifference.Removed
+
+    def is_modified(self):
+        return self.action == CatalogDifference.Modified
+
+
+
+class CatalogDiff:
+    """ Iterates through the CatalogDifferences between two Catalogs """
+
+    # DirectoryEntry fields to compare and their index in the result rows
+    # (see DirectoryEntry.catalog_db_fields())
+    compared_fields = [ ('content_hash', 4), ('size',  6), ('mode', 7),
+                        ('mtime',        8), ('symlink', 10) ]
+
+    def __init__(self, old_catalog, new_catalog):
+        """ Either of the catalogs might be None (i.e. an empty catalog) """
+        self.old_catalog = old_catalog
+        self.new_catalog = new_catalog
+
+    def __iter__(self):
+        old_rows = self._stream(self.old_catalog)
+        new_rows = self._stream(self.new_catalog)
+        old_row  = next(old_rows, None)
+        new_row  = next(new_rows, None)
+        while old_row is not None or new_row is not None:
+            if new_row is None or \
+               (old_row is not None and old_row[0:2] < new_row[0:2]):
+                yield self._removed(old_row)
+                old_row = next(old_rows, None)
+            elif old_row is None or new_row[0:2] < old_row[0:2]:
+                yield self._added(new_row)
+                new_row = next(new_rows, None)
+            else:
+                changed_fields = self._compare(old_row, new_row)
+                if changed_fields:
+                    yield self._modified(old_row, new_row, changed_fields)
+                old_row = next(old_rows, None)
+                new_row = next(new_rows, None)
+
+
+    @staticmethod
+    def _stream(catalog):
+        if catalog is None:
+            return iter([])
+        return catalog.iterate_sql("SELECT " + DirectoryEntry.catalog_db_fields() + " \
+                                    FROM catalog                                       \
+                                    ORDER BY md5path_1 ASC, md5path_2 ASC;")
+
+    @staticmethod
+    def _compare(old_row, new_row):
+        return tuple([ field for field, idx in CatalogDiff.compared_fields
+                             if old_row[idx] != new_row[idx] ])
+
+    def _removed(self, old_row):
+        old_dirent = self.old_catalog._make_directory_entry(old_row)
+        return CatalogDifference(CatalogDifference.Removed, old_dirent, None)
+
+    def _added(self, new_row):
+        new_dirent = self.new_catalog._make_directory_entry(new_row)
+        return CatalogDifference(CatalogDifference.Added, None, new_dirent)
+
+    def _modified(self, old_row, new_row, changed_fields):
+        old_dirent = self.old_catalog._make_directory_entry(old_row)
+        new_dirent = self.new_catalog._make_directory_entry(new_row)
+        return CatalogDifference(CatalogDifference.Modified,
+                                 old_dirent, new_dirent, changed_fields)
+
+
+
+class RepositoryDiff:
+    """ Iterates through the differences between two repository revisions
+
+    Yields tuples of the affected catalog's mountpoint and a CatalogDifference.
+    Only catalogs whose hash differs between the revisions are opened, these
+    are listed as (mountpoint, old hash, new hash) in changed_catalogs. Note
+    that entries moving between catalogs (i.e. when a nested catalog is added
+    or removed) are reported as removed in one and added in the other catalog.
+    """
+
+    def __init__(self, old_repository, old_root_hash,
+                       new_repository, new_root_hash):
+        self.old_repository    = old_repository
+        self.new_repository    = new_repository
+        self.old_root_hash     = old_root_hash
+        self.new_root_hash     = new_root_hash
+        self.compared_catalogs = 0
+        self.skipped_catalogs  = 0
+        self.changed_catalogs  = []
+
+    def __iter__(self):
+        pending = collections.deque()
+        pending.append(("/", self.old_root_hash, self.new_root_hash))
+        while pending:
+            mountpoint, old_hash, new_hash = pending.pop()
+            if old_hash == new_hash:
+                self.skipped_catalogs += 1
+                continue
+            self.compared_catalogs += 1
+            self.changed_catalogs.append((mountpoint, old_hash, new_hash))
+            old_catalog = self._retrieve(self.old_repository, old_hash)
+            new_catalog = self._retrieve(self.new_repository, new_hash)
+            for difference in CatalogDiff(old_catalog, new_catalog):
+                yield mountpoint, difference
+            pending.extend(self._pair_nested(old_catalog, new_catalog))
+
+
+    @staticmethod
+    def _retrieve(repository, catalog_hash):
+        if catalog_hash is None:
+            return None
+        return repository.retrieve_catalog(catalog_hash)
+
+    @staticmethod
+    def _pair_nested(old_catalog, new_catalog):
+        """ Match the nested catalogs of both revisions by their mountpoint """
+        old_nested = RepositoryDiff._nested_hashes(old_catalog)
+        new_nested = RepositoryDiff._nested_hashes(new_catalog)
+        mountpoints = set(old_nested.keys()) | set(new_nested.keys())
+        return [ (mountpoint, old_nested.get(mountpoint),
+                              new_nested.get(mountpoint))
+                 for mountpoint in sorted(mountpoints, reverse = True) ]
+
+    @staticmethod
+    def _nested_hashes(catalog):
+        if catalog is None:
+            return {}
+        return dict([ (nested_ref.root_path, nested_ref.hash)
+                      for nested_ref in catalog.list_nested() ])
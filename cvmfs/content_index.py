@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Local reverse index from content hashes to the directory entries referencing
+them. Both the content hashes of regular files and the hashes of file chunks
+are indexed, the latter pointing to the chunked file they belong to.
+"""
+
+import binascii
+import collections
+
+from revision_index import RevisionIndex
+
+
+class ContentReference:
+    """ A directory entry in a catalog of a revision referencing an object """
+
+    def __init__(self, root_catalog, catalog_hash, md5path_1, md5path_2):
+        self.root_catalog = root_catalog
+        self.catalog_hash = catalog_hash
+        self.md5path_1    = md5path_1
+        self.md5path_2    = md5path_2
+
+    def __str__(self):
+        return "<ContentReference in " + self.catalog_hash + " - " + \
+               str(self.md5path_1) + "|" + str(self.md5path_2) + ">"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def path_hash(self):
+        return self.md5path_1, self.md5path_2
+
+
+
+class ContentIndex(RevisionIndex):
+    """ Persistent content hash -> (catalog, md5path) index of a repository """
+
+    def lookup(self, content_hash, root_catalog_hash = None):
+        """ Lists the ContentReferences of a single content hash """
+        return self.lookup_many([ content_hash ], root_catalog_hash)[content_hash]
+
+
+    def lookup_many(self, content_hashes, root_catalog_hash = None,
+                          batch_size = 500):
+        """ Finds the ContentReferences for a list of hex content hashes
+
+        Returns a dictionary mapping every given hash (hash suffixes are
+        ignored) to a list of references in all indexed revisions or only in
+        the revision given by its root catalog hash.
+        """
+        references = collections.defaultdict(list)
+        by_digest  = collections.defaultdict(list)
+        for content_hash in content_hashes:
+            references[content_hash] = []
+            by_digest[self._to_digest(content_hash)].append(content_hash)
+        digests = by_digest.keys()
+        for i in range(0, len(digests), batch_size):
+            batch = digests[i:i + batch_size]
+            sql   = "SELECT objects.hash, revisions.root_catalog, objects.catalog, \
+                            objects.md5path_1, objects.md5path_2                   \
+                     FROM objects INNER JOIN revisions                             \
+                       ON objects.catalog = revisions.catalog                      \
+                     WHERE objects.hash IN (" + ",".join("?" * len(batch)) + ")"
+            parameters = [ buffer(digest) for digest in batch ]
+            if root_catalog_hash is not None:
+                sql += " AND revisions.root_catalog = ?"
+                parameters.append(root_catalog_hash)
+            for row in self._db_handle.execute(sql + ";", parameters):
+                reference = ContentReference(*row[1:])
+                for content_hash in by_digest[str(row[0])]:
+                    references[content_hash].append(reference)
+        return dict(references)
+
+
+    def _create_tables(self):
+        self._db_handle.execute("CREATE TABLE IF NOT EXISTS objects            \
+                                   (hash BLOB, catalog TEXT,                   \
+                                    md5path_1 INTEGER, md5path_2 INTEGER);")
+        self._db_handle.execute("CREATE INDEX IF NOT EXISTS objects_hash       \
+                                   ON objects (hash);")
+        self._db_handle.execute("CREATE INDEX IF NOT EXISTS objects_catalog    \
+                                   ON objects (catalog);")
+
+
+    def _index_catalog_content(self, catalog):
+        queries = [ "SELECT hash, md5path_1, md5path_2 FROM catalog \
+                     WHERE length(hash) > 0;" ]
+        if catalog.schema >= 2.4:
+            queries.append("SELECT hash, md5path_1, md5path_2 FROM chunks;")
+        for sql in queries:
+            self._db_handle.executemany("INSERT INTO objects VALUES (?, ?, ?, ?);",
+                                        ((content_hash, catalog.hash,
+                                          md5path_1, md5path_2)
+                                         for content_hash, md5path_1, md5path_2
+                                         in catalog.iterate_sql(sql)))
+
+
+    def _forget_catalog_content(self, catalog_hash):
+        self._db_handle.execute("DELETE FROM objects WHERE catalog = ?;",
+                                (catalog_hash,))
+
+
+    @staticmethod
+    def _to_digest(content_hash):
+        return binascii.unhexlify(content_hash.split("-")[0])
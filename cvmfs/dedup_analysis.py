@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Determines the logical and the deduplicated (unique) size of a repository
+revision. All referenced objects are spilled into a temporary sqlite database
+and grouped by content hash there, which uses sqlite's external merge sort.
+Hence, memory consumption doesn't depend on the number of objects.
+"""
+
+import heapq
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from _common import _binary_buffer_to_hex_string
+from dirent  import _Flags
+
+
+class DuplicatedObject:
+    """ A content object referenced more than once """
+
+    def __init__(self, content_hash, size, references):
+        self.content_hash = content_hash
+        self.size         = size
+        self.references   = references
+
+    def __str__(self):
+        return "<DuplicatedObject " + self.content_hash + " - " + \
+               str(self.references) + "x " + str(self.size) + " bytes>"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def redundant_size(self):
+        """ bytes saved by storing the object only once """
+        return (self.references - 1) * self.size
+
+
+
+class DeduplicationReport:
+    """ Logical versus unique object counts and sizes of a revision
+
+    Chunked files are accounted for by their chunks, i.e. a chunk shared by
+    multiple files is stored only once. The top_duplicates list holds the
+    DuplicatedObjects with the largest redundant size, largest first.
+    """
+
+    def __init__(self, root_catalog_hash):
+        self.root_catalog    = root_catalog_hash
+        self.logical_objects = 0
+        self.logical_size    = 0
+        self.unique_objects  = 0
+        self.unique_size     = 0
+        self.top_duplicates  = []
+
+    def __str__(self):
+        return "<DeduplicationReport for " + self.root_catalog + ">"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def redundant_size(self):
+        return self.logical_size - self.unique_size
+
+    def deduplication_ratio(self):
+        if self.unique_size == 0:
+            return 1.0
+        return float(self.logical_size) / self.unique_size
+
+
+
+def _spill_catalog(db_handle, catalog):
+    """ Writes all (content hash, size) pairs of a catalog's objects """
+    queries = [ "SELECT hash, size FROM catalog                            \
+                 WHERE length(hash) > 0 AND                                \
+                       (flags & " + str(_Flags.FileChunk) + ") = 0;" ]
+    if catalog.schema >= 2.4:
+        queries.append("SELECT hash, size FROM chunks;")
+    for sql in queries:
+        db_handle.executemany("INSERT INTO objects VALUES (?, ?);",
+                              catalog.iterate_sql(sql))
+
+
+def analyze_deduplication(repository, top_n = 10, work_dir = None):
+    """ Computes the DeduplicationReport of the repository's current revision
+
+    The temporary database is created in work_dir (the system's temporary
+    directory by default) and removed afterwards.
+    """
+    report   = DeduplicationReport(repository.manifest.root_catalog)
+    temp_dir = tempfile.mkdtemp(dir = work_dir, prefix = 'dedup.')
+    try:
+        db_handle = sqlite3.connect(os.path.join(temp_dir, 'objects.db'))
+        db_handle.execute("PRAGMA journal_mode = OFF;")
+        db_handle.execute("PRAGMA synchronous = OFF;")
+        db_handle.execute("PRAGMA temp_store = FILE;")
+        db_handle.execute("CREATE TABLE objects (hash BLOB, size INTEGER);")
+        for catalog in repository.catalogs():
+            _spill_catalog(db_handle, catalog)
+            repository.close_catalog(catalog)
+        db_handle.commit()
+
+        top_duplicates = []
+        cursor = db_handle.execute("SELECT hash, max(size), count(*)       \
+                                    FROM objects GROUP BY hash;")
+        for content_hash, size, references in cursor:
+            report.logical_objects += references
+            report.logical_size    += references * size
+            report.unique_objects  += 1
+            report.unique_size     += size
+            if references > 1 and top_n > 0:
+                entry = ((references - 1) * size, str(content_hash), size, references)
+                if len(top_duplicates) < top_n:
+                    heapq.heappush(top_duplicates, entry)
+                else:
+                    heapq.heappushpop(top_duplicates, entry)
+        db_handle.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+    report.top_duplicates = [ DuplicatedObject(_binary_buffer_to_hex_string(digest),
+                                               size, references)
+                              for _, digest, size, references
+                              in sorted(top_duplicates, reverse = True) ]
+    return report
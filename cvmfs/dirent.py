@@ -5,7 +5,9 @@ Created by René Meusel
 This file is part of the CernVM File System auxiliary tools.
 """
 
-from _common import _binary_buffer_to_hex_string
+import binascii
+
+from _common import _binary_buffer_to_hex_string, _to_unix_timestamp
 
 
 class _Flags:
@@ -37,9 +39,28 @@ class ContentHashTypes:
             return ""
 
 
-class Chunk:
+def _content_hash_type_shift():
+    """ number of right shifts to move the content hash type bits to bit 0 """
+    bit_mask     = _Flags.ContentHashType
+    right_shifts = 0
+    while bit_mask & 1 == 0:
+        bit_mask >>= 1
+        right_shifts += 1
+    return right_shifts
+
+_ContentHashTypeShift = _content_hash_type_shift()
+
+
+def _picklable(value):
+    """ BLOB columns are read as buffer objects that cannot be pickled """
+    return str(value) if isinstance(value, buffer) else value
+
+
+class Chunk(object):
     """ Wrapper around file chunks in the CVMFS catalogs """
 
+    __slots__ = [ 'offset', 'size', 'content_hash', 'content_hash_type' ]
+
     def __init__(self, chunk_data, content_hash_type):
         if len(chunk_data) != 5:
             raise Exception("Result set doesn't match")
@@ -52,6 +73,13 @@ class Chunk:
     def __repr__(self):
         return "<Chunk " + str(self.offset) + " - " + str(self.size) + ">"
 
+    def __getstate__(self):
+        return [ _picklable(getattr(self, slot)) for slot in Chunk.__slots__ ]
+
+    def __setstate__(self, state):
+        for slot, value in zip(Chunk.__slots__, state):
+            setattr(self, slot, value)
+
     def content_hash_string(self):
         suffix = ContentHashTypes.to_suffix(self.content_hash_type)
         return _binary_buffer_to_hex_string(self.content_hash) + suffix
@@ -61,8 +89,17 @@ class Chunk:
         return "md5path_1, md5path_2, offset, size, hash"
 
 
-class DirectoryEntry:
-    """ Thin wrapper around a DirectoryEntry as it is saved in the Catalogs """
+class DirectoryEntry(object):
+    """ Thin wrapper around a DirectoryEntry as it is saved in the Catalogs
+
+    Uses __slots__ to keep the memory footprint low as a repository walk might
+    keep millions of entries alive. Derived fields (content hash type and
+    string) are computed on demand.
+    """
+
+    __slots__ = [ 'md5path_1', 'md5path_2', 'parent_1', 'parent_2',
+                  'content_hash', 'flags', 'size', 'mode', 'mtime', 'name',
+                  'symlink', '_chunks' ]
 
     def __init__(self, result_set):
         # see DirectoryEntry._catalog_db_fields()
@@ -71,8 +108,7 @@ class DirectoryEntry:
         self.md5path_1, self.md5path_2, self.parent_1, self.parent_2,    \
         self.content_hash, self.flags, self.size, self.mode, self.mtime, \
         self.name, self.symlink = result_set
-        self.chunks = []
-        self._read_content_hash_type()
+        self._chunks = None
 
     def __str__(self):
         return "<DirectoryEntry for '" + self.name + "'>"
@@ -81,12 +117,31 @@ class DirectoryEntry:
         return "<DirectoryEntry '" + self.name + "' - " + \
                str(self.md5path_1) + "|" + str(self.md5path_2) + ">"
 
+    def __getstate__(self):
+        return [ _picklable(getattr(self, slot))
+                 for slot in DirectoryEntry.__slots__ ]
+
+    def __setstate__(self, state):
+        for slot, value in zip(DirectoryEntry.__slots__, state):
+            setattr(self, slot, value)
+
     @staticmethod
     def catalog_db_fields():
         # see DirectoryEntry.__init__()
         return "md5path_1, md5path_2, parent_1, parent_2, hash, \
                 flags, size, mode, mtime, name, symlink"
 
+    @property
+    def chunks(self):
+        return self._chunks if self._chunks is not None else []
+
+    @property
+    def content_hash_type(self):
+        hash_type = ((self.flags & _Flags.ContentHashType) >> \
+                     _ContentHashTypeShift) + 1
+        return hash_type if 0 < hash_type < ContentHashTypes.UpperBound \
+                         else ContentHashTypes.Unknown
+
     def retrieve_from(self, repository):
         if self.is_symlink():
             raise Exception("Cannot retrieve symlink")
@@ -106,6 +161,9 @@ class DirectoryEntry:
     def is_file(self):
         return (self.flags & _Flags.File) > 0
 
+    def is_chunked_file(self):
+        return (self.flags & _Flags.FileChunk) > 0
+
     def is_symlink(self):
         return (self.flags & _Flags.Link) > 0
 
@@ -120,22 +178,12 @@ class DirectoryEntry:
         return _binary_buffer_to_hex_string(self.content_hash) + suffix
 
     def has_chunks(self):
-        return bool(self.chunks)
+        return bool(self._chunks)
 
     def _add_chunks(self, result_set):
-        self.chunks = [ Chunk(chunk_data, self.content_hash_type)
-                        for chunk_data in result_set ]
-
-    def _read_content_hash_type(self):
-        bit_mask     = _Flags.ContentHashType
-        right_shifts = 0
-        while bit_mask & 1 == 0:
-            bit_mask >>= 1
-            right_shifts += 1
-        hash_type = ((self.flags & _Flags.ContentHashType) >> right_shifts) + 1
-        self.content_hash_type = \
-            hash_type if 0 < hash_type < ContentHashTypes.UpperBound \
-                      else ContentHashTypes.Unknown
+        content_hash_type = self.content_hash_type
+        self._chunks = [ Chunk(chunk_data, content_hash_type)
+                         for chunk_data in result_set ]
 
     # def BacktracePath(self, containing_catalog, repo):
     #     """ Tries to reconstruct the full path of a DirectoryEntry """
@@ -153,3 +201,68 @@ class DirectoryEntry:
     #         else:
     #             break
     #     return path
+
+
+class DirectoryEntryFilter:
+    """ Predicates on DirectoryEntries that are evaluated by sqlite
+
+    All given criteria need to match. Sizes are in bytes, modification times
+    are either UNIX timestamps or datetime objects, 'flags' is a bit mask of
+    required flags (e.g. DirectoryEntryFilter.File), 'name_pattern' is a
+    case-sensitive glob matched against the entry name (not the full path)
+    and 'content_hash' a hex content hash (with optional suffix).
+    """
+
+    Directory   = _Flags.Directory
+    File        = _Flags.File
+    Symlink     = _Flags.Link
+    ChunkedFile = _Flags.FileChunk
+
+    def __init__(self, min_size        = None, max_size        = None,
+                       modified_since  = None, modified_before = None,
+                       flags           = None, name_pattern    = None,
+                       content_hash    = None):
+        self.min_size        = min_size
+        self.max_size        = max_size
+        self.modified_since  = modified_since
+        self.modified_before = modified_before
+        self.flags           = flags
+        self.name_pattern    = name_pattern
+        self.content_hash    = content_hash
+
+
+    def sql_condition(self, include_mountpoints = False):
+        """ Translates the filter into an SQL expression and its parameters
+
+        With include_mountpoints, nested catalog mountpoints always match so
+        that a repository walk can descend into them.
+        """
+        clauses    = []
+        parameters = []
+        if self.min_size is not None:
+            clauses.append("size >= ?")
+            parameters.append(self.min_size)
+        if self.max_size is not None:
+            clauses.append("size <= ?")
+            parameters.append(self.max_size)
+        if self.modified_since is not None:
+            clauses.append("mtime >= ?")
+            parameters.append(_to_unix_timestamp(self.modified_since))
+        if self.modified_before is not None:
+            clauses.append("mtime < ?")
+            parameters.append(_to_unix_timestamp(self.modified_before))
+        if self.flags is not None:
+            clauses.append("(flags & ?) = ?")
+            parameters.extend([ self.flags, self.flags ])
+        if self.name_pattern is not None:
+            clauses.append("name GLOB ?")
+            parameters.append(self.name_pattern)
+        if self.content_hash is not None:
+            clauses.append("hash = ?")
+            parameters.append(buffer(binascii.unhexlify(self.content_hash.split("-")[0])))
+        condition = " AND ".join(clauses) if clauses else "1"
+        if include_mountpoints:
+            condition = "(" + condition + ") OR (flags & " + \
+                        str(_Flags.NestedCatalogMountpoint) + ")"
+        return condition, parameters
+
@@ -7,22 +7,31 @@ This file is part of the CernVM File System auxiliary tools.
 
 import datetime
 
-from _common import DatabaseObject
+from _common import DatabaseObject, _to_unix_timestamp
 
-class RevisionTag:
+class RevisionTag(object):
     """ Specific revisions in CernVM-FS 2.1.x repositories have named tags  """
+
+    __slots__ = [ 'name', 'hash', 'revision', 'channel', 'description',
+                  '_unix_timestamp', '_timestamp' ]
+
+    @staticmethod
+    def sql_fields():
+        return "name, hash, revision, timestamp, channel, description"
+
     @staticmethod
     def sql_query():
-        return '''SELECT name, hash, revision, timestamp, channel, description
-                  FROM tags ORDER BY timestamp DESC'''
+        return "SELECT " + RevisionTag.sql_fields() + " \
+                FROM tags ORDER BY timestamp DESC"
 
     def __init__(self, sql_result):
-        self.name        = sql_result[0]
-        self.hash        = sql_result[1]
-        self.revision    = int(sql_result[2])
-        self.timestamp   = datetime.datetime.fromtimestamp(int(sql_result[3]))
-        self.channel     = int(sql_result[4])
-        self.description = sql_result[5]
+        self.name             = sql_result[0]
+        self.hash             = sql_result[1]
+        self.revision         = int(sql_result[2])
+        self._unix_timestamp  = int(sql_result[3])
+        self._timestamp       = None
+        self.channel          = int(sql_result[4])
+        self.description      = sql_result[5]
 
     def __str__(self):
         return "<RevisionTag '" + self.name + "'>"
@@ -30,9 +39,20 @@ class RevisionTag:
     def __repr__(self):
         return self.__str__()
 
+    @property
+    def timestamp(self):
+        """ the tag's (local) creation time, converted on first access """
+        if self._timestamp is None:
+            self._timestamp = datetime.datetime.fromtimestamp(self._unix_timestamp)
+        return self._timestamp
+
 
 class History(DatabaseObject):
-    """ Wrapper around CernVM-FS 2.1.x repository history databases """
+    """ Wrapper around CernVM-FS 2.1.x repository history databases
+
+    The find_* and get_* methods translate into parameterized SQL queries and
+    (apart from get_*) lazily generate RevisionTags newest first.
+    """
 
     @staticmethod
     def open(history_path):
@@ -51,11 +71,59 @@ class History(DatabaseObject):
         return self.__str__()
 
     def __iter__(self):
-        return self.list_tags().__iter__()
+        return self.iterate_tags()
 
     def list_tags(self):
-        results = self.run_sql(RevisionTag.sql_query())
-        return [ RevisionTag(sql_res) for sql_res in results ]
+        return list(self.iterate_tags())
+
+    def iterate_tags(self):
+        return self._query_tags()
+
+    def get_tag_by_name(self, name):
+        """ Finds a tag by its (unique) name, None if there is no such tag """
+        return next(self._query_tags("name = ?", (name,)), None)
+
+    def find_tags_by_revision(self, revision):
+        return self._query_tags("revision = ?", (revision,))
+
+    def find_tags_by_channel(self, channel):
+        return self._query_tags("channel = ?", (channel,))
+
+    def find_tags_in_time_range(self, start = None, end = None):
+        """ Tags created in [start, end), both either datetimes (naive ones are
+            local time as in RevisionTag.timestamp) or UNIX timestamps; None is
+            unbounded """
+        conditions = []
+        parameters = []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append(_to_unix_timestamp(start))
+        if end is not None:
+            conditions.append("timestamp < ?")
+            parameters.append(_to_unix_timestamp(end))
+        return self._query_tags(" AND ".join(conditions), parameters)
+
+    def get_tag_at(self, timestamp):
+        """ Finds the most recent tag created at or before the given time """
+        return next(self._query_tags("timestamp <= ?",
+                                     (_to_unix_timestamp(timestamp),)), None)
+
+    def get_latest_tags_per_channel(self):
+        """ Returns a dictionary mapping each channel to its most recent tag """
+        # sqlite takes bare columns from the row providing max(timestamp)
+        results = self.iterate_sql("SELECT name, hash, revision, max(timestamp), \
+                                           channel, description                  \
+                                    FROM tags GROUP BY channel;")
+        tags    = [ RevisionTag(sql_res) for sql_res in results ]
+        return dict([ (tag.channel, tag) for tag in tags ])
+
+    def _query_tags(self, condition = "", parameters = ()):
+        sql = "SELECT " + RevisionTag.sql_fields() + " FROM tags"
+        if condition:
+            sql += " WHERE " + condition
+        sql += " ORDER BY timestamp DESC;"
+        for sql_res in self.iterate_sql(sql, parameters):
+            yield RevisionTag(sql_res)
 
     def _read_properties(self):
         self.read_properties_table(lambda prop_key, prop_value:
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+"""
+
+import json
+import os
+import tempfile
+
+from _common import _PATH_ENCODING
+from catalog import Catalog, CatalogReference, NestedCatalogIndex
+
+
+class MountpointMap:
+    """ Maps nested catalog mountpoints to catalog hashes of a single revision
+
+    The map is filled lazily: a catalog's nested catalogs are added once the
+    first path below its mountpoint is resolved ('expanded' catalogs). After
+    that, resolving a path to its catalog is a single longest-prefix lookup.
+    The map is bound to a root catalog hash and can be persisted to disk.
+    """
+
+    @staticmethod
+    def load(map_path, root_catalog_hash):
+        """ Load a persisted map if it was built for the given root catalog """
+        try:
+            with open(map_path) as map_file:
+                data = json.load(map_file)
+        except (IOError, ValueError), e:
+            return None
+        if data.get('root_catalog') != root_catalog_hash:
+            return None
+        mountpoint_map = MountpointMap(root_catalog_hash, data['revision'])
+        path_encoding  = data.get('path_encoding', 'utf-8')
+        try:
+            for mountpoint, catalog_hash, expanded in data['mountpoints']:
+                reference = CatalogReference(mountpoint.encode(path_encoding),
+                                             catalog_hash.encode('ascii'))
+                mountpoint_map._add(reference, expanded)
+        except (UnicodeError, LookupError), e:
+            return None
+        mountpoint_map._dirty = False
+        return mountpoint_map
+
+
+    def __init__(self, root_catalog_hash, revision = 0):
+        self.root_catalog = root_catalog_hash
+        self.revision     = revision
+        self._index       = NestedCatalogIndex()
+        self._references  = {}
+        self._expanded    = set()
+        self._dirty       = False
+        self._add(CatalogReference("/", root_catalog_hash), False)
+
+
+    def __str__(self):
+        return "<MountpointMap for " + self.root_catalog + ">"
+
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    def __len__(self):
+        return len(self._references)
+
+
+    def is_for(self, root_catalog_hash):
+        return self.root_catalog == root_catalog_hash
+
+
+    def find_catalog_reference(self, path, repository):
+        """ Find the CatalogReference of the catalog that contains the path """
+        real_path = Catalog._canonicalize_path(path)
+        while True:
+            reference = self._index.find_longest_prefix(real_path)
+            if reference.root_path in self._expanded:
+                return reference
+            catalog = repository.retrieve_catalog(reference.hash)
+            self._expand(reference, catalog.list_nested())
+
+
+    def save(self, map_path):
+        """ Atomically persist the map to the given path (if it changed) """
+        if not self._dirty:
+            return
+        data = { 'root_catalog'  : self.root_catalog,
+                 'revision'      : self.revision,
+                 'path_encoding' : _PATH_ENCODING,
+                 'mountpoints'   : [ (mountpoint.decode(_PATH_ENCODING),
+                                      reference.hash,
+                                      mountpoint in self._expanded)
+                                     for mountpoint, reference
+                                     in self._references.iteritems() ] }
+        map_dir = os.path.dirname(os.path.abspath(map_path))
+        fd, tmp_path = tempfile.mkstemp(dir=map_dir, prefix='tmp.')
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(data, tmp_file)
+        os.rename(tmp_path, map_path)
+        self._dirty = False
+
+
+    def _add(self, catalog_reference, expanded):
+        self._index.add(catalog_reference)
+        self._references[catalog_reference.root_path] = catalog_reference
+        if expanded:
+            self._expanded.add(catalog_reference.root_path)
+        self._dirty = True
+
+
+    def _expand(self, catalog_reference, nested_references):
+        for nested_reference in nested_references:
+            if nested_reference.root_path not in self._references:
+                self._add(nested_reference, False)
+        self._expanded.add(catalog_reference.root_path)
+        self._dirty = True
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+"""
+
+import copy
+
+import _worker
+
+
+def _walk_catalog(catalog_hash):
+    """ Iterates a single catalog in a worker process
+
+    Nested catalogs are handed over for scheduling right away. Then either
+    batches of up to batch_size (path, DirectoryEntry) records or the
+    catalog's reduced value are sent back. Nested catalog mountpoints are
+    skipped as they are listed by the nested catalog.
+    """
+    reducer, initial, batch_size = _worker.arguments
+    catalog = _worker.repository.retrieve_catalog(catalog_hash)
+    _worker.schedule([ nested_ref.hash for nested_ref in catalog.list_nested() ])
+    if reducer is None:
+        batch = []
+        for path, dirent in catalog:
+            if not dirent.is_nested_catalog_mountpoint():
+                batch.append((path, dirent))
+                if len(batch) >= batch_size:
+                    _worker.emit(batch)
+                    batch = []
+        if batch:
+            _worker.emit(batch)
+    else:
+        result = copy.deepcopy(initial)
+        for path, dirent in catalog:
+            if not dirent.is_nested_catalog_mountpoint():
+                result = reducer(result, path, dirent)
+        _worker.emit(result)
+    _worker.repository.close_catalog(catalog)
+
+
+class ParallelRepositoryWalker(object):
+    """ Walks a Repository distributing its catalogs over a process pool
+
+    Every worker fetches, opens and iterates whole catalogs on its own. Nested
+    catalogs are scheduled as soon as their parent catalog is opened. Iterating
+    the walker yields the same (path, DirectoryEntry) records as iterating a
+    Repository, though in no particular order. Every catalog is iterated once,
+    its records are streamed back from the worker in batches of batch_size.
+    """
+
+    def __init__(self, repository, processes = None, catalog_hash = None,
+                       batch_size = 10000):
+        self.repository   = repository
+        self.processes    = processes
+        self.catalog_hash = catalog_hash
+        self.batch_size   = batch_size
+        if catalog_hash is None:
+            self.catalog_hash = repository.manifest.root_catalog
+
+
+    def __iter__(self):
+        for records in self._walk(None, None):
+            for record in records:
+                yield record
+
+
+    def reduce(self, reducer, initial, combine):
+        """ Reduce all records with a user-supplied function
+
+        reducer(value, path, dirent) is applied to all records of a catalog
+        inside the worker processes starting with a copy of initial. The
+        per-catalog values are merged with combine(value, catalog_value).
+        Due to fork()ing workers the functions don't need to be picklable but
+        the reduced values do.
+        """
+        result = copy.deepcopy(initial)
+        for catalog_result in self._walk(reducer, initial):
+            result = combine(result, catalog_result)
+        return result
+
+
+    def _walk(self, reducer, initial):
+        return _worker.imap_tree(self.processes, self.repository,
+                                 _walk_catalog, [ self.catalog_hash ],
+                                 (reducer, initial, self.batch_size))
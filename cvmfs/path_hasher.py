@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+"""
+
+import hashlib
+
+from _common import _canonicalize_path, _split_md5, _split_md5_many
+
+
+class PathHasher:
+    """ Computes the split MD5 path hashes used as keys in the catalogs
+
+    Paths are canonicalized and hashed to the signed (md5path_1, md5path_2)
+    pairs found in the catalog tables. Results for absolute paths are kept in
+    a memo since the same (parent) directories are hashed over and over again
+    while browsing a repository. The memo is a plain dict that is emptied
+    once it holds memo_size paths, an LRU costs more than it saves.
+    """
+
+    def __init__(self, memo_size = 4096):
+        self.memo_size = memo_size
+        self._memo     = {}
+
+
+    def split_md5(self, path):
+        """ Computes the split MD5 hash of a single path """
+        md5path = self._memo.get(path)
+        if md5path is None:
+            real_path = _canonicalize_path(path)
+            md5path   = _split_md5(hashlib.md5(real_path).digest())
+            self._remember(path, md5path)
+        return md5path
+
+
+    def split_md5_many(self, paths):
+        """ Computes the split MD5 hashes of a list of paths in bulk """
+        results = [ self._memo.get(path) for path in paths ]
+        missing = [ idx for idx, md5path in enumerate(results) if md5path is None ]
+        digests = [ hashlib.md5(_canonicalize_path(paths[idx])).digest()
+                    for idx in missing ]
+        for idx, md5path in zip(missing, _split_md5_many(digests)):
+            results[idx] = md5path
+            self._remember(paths[idx], md5path)
+        return results
+
+
+    def clear(self):
+        self._memo.clear()
+
+
+    def _remember(self, path, md5path):
+        if not path.startswith('/'): # relative paths depend on the cwd
+            return
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[path] = md5path
+
+
+
+default_path_hasher = PathHasher()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Local full-text index of all paths in one or more repository revisions. Paths
+are stored per catalog in an sqlite FTS5 table using the trigram tokenizer, so
+that substring and glob searches don't need to scan all paths.
+"""
+
+import sqlite3
+
+from revision_index import RevisionIndex
+
+
+class PathIndex(RevisionIndex):
+    """ sqlite based substring and glob search over repository paths """
+
+    def search(self, root_catalog_hash, substring):
+        """ Yields all paths of a revision that contain the given substring """
+        return self.glob(root_catalog_hash, "*" + self._escape_glob(substring) + "*")
+
+
+    def glob(self, root_catalog_hash, pattern):
+        """ Yields all paths of a revision matching a (case-sensitive) glob
+            pattern, which has to match the full path (e.g. '*/lib*.so') """
+        cursor = self._db_handle.execute("SELECT paths.path FROM paths           \
+                                          INNER JOIN revisions                   \
+                                            ON paths.catalog = revisions.catalog \
+                                          WHERE revisions.root_catalog = ? AND   \
+                                                paths.path GLOB ?;",
+                                         (root_catalog_hash, pattern))
+        for row in cursor:
+            yield row[0]
+
+
+    def _create_tables(self):
+        """ Creates the paths table, sets full_text if FTS5 is in use """
+        try:
+            self._db_handle.execute("CREATE VIRTUAL TABLE IF NOT EXISTS paths    \
+                                       USING fts5(path, catalog UNINDEXED,       \
+                                       tokenize = 'trigram case_sensitive 1');")
+            self.full_text = True
+        except sqlite3.OperationalError, e:
+            # sqlite without FTS5 or the trigram tokenizer (< 3.34): fall back
+            # to a plain table that is scanned for every search
+            self._db_handle.execute("CREATE TABLE IF NOT EXISTS paths          \
+                                       (path TEXT, catalog TEXT);")
+            self._db_handle.execute("CREATE INDEX IF NOT EXISTS paths_catalog  \
+                                       ON paths (catalog);")
+            self.full_text = False
+
+
+    def _index_catalog_content(self, catalog):
+        self._db_handle.executemany("INSERT INTO paths VALUES (?, ?);",
+                                    ((path or "/", catalog.hash)
+                                     for path, dirent in catalog
+                                     if not dirent.is_nested_catalog_mountpoint()))
+
+
+    def _forget_catalog_content(self, catalog_hash):
+        self._db_handle.execute("DELETE FROM paths WHERE catalog = ?;",
+                                (catalog_hash,))
+
+
+    @staticmethod
+    def _escape_glob(text):
+        return "".join([ "[" + char + "]" if char in "*?[" else char
+                         for char in text ])
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Garbage collection audit: determines which objects in a repository's backend
+storage are no longer referenced by the current or any tagged revision. All
+reachable object names are collected into an sqlite table on disk, so that
+the backend's data/ directory can be streamed against it in batches.
+"""
+
+import binascii
+import collections
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from dirent import ContentHashTypes, _Flags, _ContentHashTypeShift
+
+
+class ReachableObjects:
+    """ On-disk set of object names (e.g. '28a5cd...13f4C') """
+
+    def __init__(self, db_path):
+        self._db_handle = sqlite3.connect(db_path)
+        self._db_handle.execute("PRAGMA journal_mode = OFF;")
+        self._db_handle.execute("PRAGMA synchronous = OFF;")
+        self._db_handle.execute("CREATE TABLE IF NOT EXISTS objects          \
+                                   (object BLOB PRIMARY KEY) WITHOUT ROWID;")
+
+    def __len__(self):
+        return self._db_handle.execute("SELECT count(*) FROM objects;").fetchone()[0]
+
+    def close(self):
+        self._db_handle.commit()
+        self._db_handle.close()
+
+
+    def add(self, object_name):
+        self.add_many([ object_name ])
+
+
+    def add_many(self, object_names):
+        self._db_handle.executemany("INSERT OR IGNORE INTO objects VALUES (?);",
+                                    ((self._to_key(name),) for name in object_names))
+
+
+    def contains(self, object_name):
+        return object_name in self.contains_many([ object_name ])
+
+
+    def contains_many(self, object_names, batch_size = 500):
+        """ Returns the subset of the given object names that are in the set """
+        keys  = dict([ (str(self._to_key(name)), name) for name in object_names ])
+        found = set()
+        batch_keys = keys.keys()
+        for i in range(0, len(batch_keys), batch_size):
+            batch = [ buffer(key) for key in batch_keys[i:i + batch_size] ]
+            res   = self._db_handle.execute("SELECT object FROM objects WHERE \
+                                             object IN (" +
+                                            ",".join("?" * len(batch)) + ");",
+                                            batch)
+            found.update([ keys[str(row[0])] for row in res ])
+        return found
+
+
+    @staticmethod
+    def _to_key(object_name):
+        """ hex digest and suffixes are stored as a binary digest + suffixes """
+        return buffer(binascii.unhexlify(object_name[:40]) + object_name[40:])
+
+
+
+class GarbageReport:
+    """ Summary of a reachability scan over a repository's data/ directory """
+
+    def __init__(self, root_catalogs):
+        self.root_catalogs        = root_catalogs
+        self.reachable_objects    = 0
+        self.scanned_objects      = 0
+        self.scanned_size         = 0
+        self.unreferenced_objects = 0
+        self.unreferenced_size    = 0
+        self.unreferenced         = []
+
+    def __str__(self):
+        return "<GarbageReport " + str(self.unreferenced_objects) + \
+               " unreferenced objects (" + str(self.unreferenced_size) + " bytes)>"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+
+class ReachabilityScan:
+    """ Collects all objects reachable from a repository's manifest
+
+    The manifest's root catalog, certificate and history database as well as
+    the root catalogs of all History tags (if include_tags) are traversed.
+    Catalogs shared between revisions (and hence their subtrees) are visited
+    once. Catalogs are only ever read, so the scan is safe on a live storage.
+    """
+
+    def __init__(self, repository, include_tags = True, work_dir = None):
+        self.repository       = repository
+        self.include_tags     = include_tags
+        self.root_catalogs    = []
+        self._temp_dir        = tempfile.mkdtemp(dir = work_dir, prefix = 'reach.')
+        self._reachable       = ReachableObjects(os.path.join(self._temp_dir,
+                                                              'reachable.db'))
+        self._collected       = False
+        self._scanned_objects = 0
+        self._scanned_size    = 0
+
+
+    def close(self):
+        self._reachable.close()
+        shutil.rmtree(self._temp_dir)
+
+
+    def collect(self):
+        """ Fills the set of reachable objects, returns its size """
+        if self._collected:
+            return len(self._reachable)
+        manifest = self.repository.manifest
+        self.root_catalogs = [ manifest.root_catalog ]
+        self._reachable.add(manifest.certificate + 'X')
+        if self.repository.has_history():
+            self._reachable.add(manifest.history_database + 'H')
+            if self.include_tags:
+                history = self.repository.retrieve_history()
+                for tag in history:
+                    if tag.hash not in self.root_catalogs:
+                        self.root_catalogs.append(tag.hash)
+        for root_catalog in self.root_catalogs:
+            self._collect_catalog_tree(root_catalog)
+        self._collected = True
+        return len(self._reachable)
+
+
+    def iterate_unreferenced(self, storage_dir, batch_size = 10000):
+        """ Streams the storage's data/ directory yielding (path, size) pairs
+            of all objects that are not reachable """
+        self.collect()
+        data_dir = os.path.join(storage_dir, 'data')
+        for subdir in sorted(os.listdir(data_dir)):
+            subdir_path = os.path.join(data_dir, subdir)
+            if len(subdir) != 2 or not os.path.isdir(subdir_path):
+                continue # i.e. data/txn
+            names = collections.deque()
+            for name in os.listdir(subdir_path):
+                names.append(subdir + name)
+                if len(names) >= batch_size:
+                    for result in self._unreferenced(data_dir, names):
+                        yield result
+                    names.clear()
+            for result in self._unreferenced(data_dir, names):
+                yield result
+
+
+    def audit(self, storage_dir, list_objects = False):
+        """ Creates a GarbageReport for the given backend storage directory """
+        reachable_objects        = self.collect()
+        report                   = GarbageReport(self.root_catalogs)
+        report.reachable_objects = reachable_objects
+        for path, size in self.iterate_unreferenced(storage_dir):
+            report.unreferenced_objects += 1
+            report.unreferenced_size    += size
+            if list_objects:
+                report.unreferenced.append(path)
+        report.scanned_objects = self._scanned_objects
+        report.scanned_size    = self._scanned_size
+        return report
+
+
+    def _unreferenced(self, data_dir, names):
+        reachable = self._reachable.contains_many([ name for name in names
+                                                    if self._is_object(name) ])
+        for name in names:
+            path = os.path.join(data_dir, name[:2], name[2:])
+            size = os.path.getsize(path)
+            self._scanned_objects += 1
+            self._scanned_size    += size
+            if name not in reachable:
+                yield "data/" + name[:2] + "/" + name[2:], size
+
+
+    @staticmethod
+    def _is_object(name):
+        try:
+            binascii.unhexlify(name[:40])
+            return len(name) >= 40
+        except TypeError, e:
+            return False
+
+
+    def _collect_catalog_tree(self, root_catalog_hash):
+        pending = collections.deque([ root_catalog_hash ])
+        while pending:
+            catalog_hash = pending.pop()
+            if self._reachable.contains(catalog_hash + 'C'):
+                continue # identical subtree was already collected
+            catalog = self.repository.retrieve_catalog(catalog_hash)
+            self._reachable.add_many(self._list_catalog_objects(catalog))
+            self._reachable.add(catalog_hash + 'C')
+            pending.extend([ nested_ref.hash for nested_ref in catalog.list_nested() ])
+            self.repository.close_catalog(catalog)
+
+
+    @staticmethod
+    def _list_catalog_objects(catalog):
+        """ Object names of all files and file chunks in a catalog """
+        for content_hash, flags in catalog.iterate_sql(
+                                    "SELECT hash, flags FROM catalog \
+                                     WHERE length(hash) > 0;"):
+            yield ReachabilityScan._object_name(content_hash, flags, '')
+        if catalog.schema < 2.4:
+            return
+        for content_hash, flags in catalog.iterate_sql(
+                                    "SELECT chunks.hash, catalog.flags     \
+                                     FROM chunks INNER JOIN catalog        \
+                                       ON chunks.md5path_1 = catalog.md5path_1 AND \
+                                          chunks.md5path_2 = catalog.md5path_2;"):
+            yield ReachabilityScan._object_name(content_hash, flags, 'P')
+
+    @staticmethod
+    def _object_name(content_hash, flags, suffix):
+        hash_type = (flags & _Flags.ContentHashType) >> _ContentHashTypeShift
+        return binascii.hexlify(content_hash) + \
+               ContentHashTypes.to_suffix(hash_type + 1) + suffix
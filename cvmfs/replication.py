@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Stratum 1 style replication of a repository into a local directory. Only the
+catalogs that changed since the target's last replicated revision are diffed
+and only the objects they newly reference are downloaded (if missing). The
+manifest, the whitelist and the snapshot timestamp are written last, hence a
+client never sees a revision whose objects are not yet complete.
+"""
+
+import cStringIO
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+import _common
+from catalog_diff import RepositoryDiff
+from manifest import Manifest
+from repository import Repository, CannotReplicate
+
+
+class Replicator:
+    """ Incrementally replicates a source Repository into target_dir
+
+    Up to max_parallel_downloads objects are downloaded concurrently. After
+    replicate() the counters describe the work done by the last run. Catalogs
+    of the target are decompressed into a temporary cache directory created
+    in work_dir (the system's temporary directory by default) that is removed
+    at the end of every run.
+    """
+
+    def __init__(self, source, target_dir, max_parallel_downloads = 8,
+                       work_dir = None):
+        self.source                 = source
+        self.target_dir             = target_dir
+        self.max_parallel_downloads = max_parallel_downloads
+        self.work_dir               = work_dir
+        self.compared_catalogs      = 0
+        self.skipped_catalogs       = 0
+        self.downloaded_objects     = 0
+        self.present_objects        = 0
+
+
+    def __str__(self):
+        return "<Replicator " + self.source.fqrn + " -> " + self.target_dir + ">"
+
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    def replicate(self):
+        """ Brings the target up to date, returns the new root catalog hash
+
+        Manifest and whitelist are downloaded once up front. The replicated
+        revision is the one of that manifest, even if the source publishes
+        a new revision meanwhile, and exactly those bytes are written last.
+        """
+        self.compared_catalogs  = 0
+        self.skipped_catalogs   = 0
+        self.downloaded_objects = 0
+        self.present_objects    = 0
+        whitelist_content = self._download(_common._WHITELIST_NAME)
+        manifest_content  = self._download(_common._MANIFEST_NAME)
+        manifest          = Manifest(manifest_content)
+        self._create_structure()
+        cache_dir = tempfile.mkdtemp(dir = self.work_dir, prefix = 'replication.')
+        try:
+            target   = self._open_target(cache_dir)
+            old_root = self._get_replicated_root(target, manifest)
+            self._write_timestamp(_common._REPLICATING_NAME)
+
+            objects = set([ manifest.certificate + 'X' ])
+            if manifest.has_history():
+                objects.add(manifest.history_database + 'H')
+            catalogs = set()
+            if old_root != manifest.root_catalog:
+                old_repository = target if old_root else self.source
+                diff = RepositoryDiff(old_repository, old_root,
+                                      self.source,    manifest.root_catalog)
+                for _, difference in diff:
+                    objects.update(self._new_objects(difference))
+                catalogs = set([ new_hash + 'C' for _, _, new_hash
+                                                in diff.changed_catalogs
+                                                if new_hash is not None ])
+                self.compared_catalogs = diff.compared_catalogs
+                self.skipped_catalogs  = diff.skipped_catalogs
+        finally:
+            shutil.rmtree(cache_dir)
+
+        # catalogs go after the data they reference, metadata after everything
+        self._replicate_objects(objects)
+        self._replicate_objects(catalogs)
+        self._write_file(_common._WHITELIST_NAME, whitelist_content)
+        self._write_file(_common._MANIFEST_NAME,  manifest_content)
+        self._write_timestamp(_common._LAST_REPLICATION_NAME)
+        os.unlink(os.path.join(self.target_dir, _common._REPLICATING_NAME))
+        return manifest.root_catalog
+
+
+    def _create_structure(self):
+        for subdir in [ 'data', os.path.join('data', 'txn') ] + \
+                      [ os.path.join('data', '%02x' % i) for i in range(256) ]:
+            path = os.path.join(self.target_dir, subdir)
+            if not os.path.isdir(path):
+                os.makedirs(path, 0755)
+
+
+    def _get_replicated_root(self, target, manifest):
+        """ Root catalog hash of the target (None for an empty target) """
+        if target is None:
+            return None
+        if target.fqrn != self.source.fqrn or \
+           target.manifest.revision > manifest.revision:
+            raise CannotReplicate(self.source)
+        return target.manifest.root_catalog
+
+
+    def _open_target(self, cache_dir):
+        """ Opens the target repository (None for an empty target) """
+        if not os.path.exists(os.path.join(self.target_dir,
+                                           _common._MANIFEST_NAME)):
+            return None
+        return Repository(self.target_dir, cache_dir)
+
+
+    @staticmethod
+    def _new_objects(difference):
+        """ Names of the objects referenced by an added or changed entry """
+        dirent = difference.new_dirent
+        if dirent is None or not (difference.is_added() or
+                                  'content_hash' in difference.changed_fields):
+            return []
+        if dirent.is_chunked_file():
+            return [ chunk.content_hash_string() + 'P' for chunk in dirent.chunks ]
+        if dirent.content_hash:
+            return [ dirent.content_hash_string() ]
+        return []
+
+
+    def _replicate_objects(self, object_names):
+        pool = ThreadPool(self.max_parallel_downloads)
+        try:
+            for downloaded in pool.imap_unordered(self._replicate_object,
+                                                  object_names, 64):
+                if downloaded:
+                    self.downloaded_objects += 1
+                else:
+                    self.present_objects    += 1
+        finally:
+            pool.close()
+            pool.join()
+
+
+    def _replicate_object(self, object_name):
+        object_path = Repository._object_path(object_name)
+        if os.path.exists(os.path.join(self.target_dir, object_path)):
+            return False
+        self._replicate_file(object_path)
+        return True
+
+
+    def _replicate_file(self, file_name):
+        """ Downloads into data/txn and atomically moves the file in place """
+        fd, tmp_path = tempfile.mkstemp(dir = os.path.join(self.target_dir,
+                                                           'data', 'txn'),
+                                        prefix = 'tmp.')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                self.source.retrieve_raw_file_into(file_name, tmp_file)
+            os.chmod(tmp_path, 0644)
+            os.rename(tmp_path, os.path.join(self.target_dir, file_name))
+        except:
+            os.unlink(tmp_path)
+            raise
+
+
+    def _download(self, file_name):
+        """ Reads a raw file of the source into memory (bypassing the cache) """
+        content = cStringIO.StringIO()
+        self.source.retrieve_raw_file_into(file_name, content)
+        return content.getvalue()
+
+
+    def _write_timestamp(self, file_name):
+        self._write_file(file_name,
+                         datetime.utcnow().strftime("%a %b %d %H:%M:%S UTC %Y\n"))
+
+
+    def _write_file(self, file_name, content):
+        """ Atomically places the given content into the target """
+        fd, tmp_path = tempfile.mkstemp(dir = os.path.join(self.target_dir,
+                                                           'data', 'txn'),
+                                        prefix = 'tmp.')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_path, 0644)
+        os.rename(tmp_path, os.path.join(self.target_dir, file_name))
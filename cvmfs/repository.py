@@ -10,16 +10,27 @@ import os
 import tempfile
 import requests
 import collections
+import copy
 from datetime import datetime
 import dateutil.parser
 from dateutil.tz import tzutc
 import shutil
+import weakref
 import zlib
 
 import _common
 import cvmfs
 from manifest import Manifest
-from catalog import Catalog
+from catalog import Catalog, CatalogIterator
+from catalog_diff import RepositoryDiff
+from mountpoint_map import MountpointMap
+from repository_statistics import collect_statistics
+from dedup_analysis import analyze_deduplication
+from reachability import ReachabilityScan
+from parallel_walker import ParallelRepositoryWalker
+from walk_checkpoint import WalkCheckpoint
+from path_index import PathIndex
+from content_index import ContentIndex
 from history import History
 from whitelist import Whitelist
 from certificate import Certificate
@@ -61,6 +72,14 @@ class HistoryNotFound(Exception):
     def __str__(self):
         return repr(self.repo)
 
+class TagNotFound(Exception):
+    def __init__(self, repo, tag_name):
+        self.repo     = repo
+        self.tag_name = tag_name
+
+    def __str__(self):
+        return repr(self.repo) + " " + self.tag_name
+
 class CannotReplicate(Exception):
     def __init__(self, repo):
         self.repo = repo
@@ -88,14 +107,31 @@ class RepositoryIterator(object):
     """ Iterates through all directory entries in a whole Repository """
 
     class _CatalogIterator:
-        def __init__(self, catalog):
+        def __init__(self, catalog, root_path = None, root_dirent = None,
+                           entry_filter = None):
             self.catalog          = catalog
-            self.catalog_iterator = catalog.__iter__()
-
-
-    def __init__(self, repository, catalog_hash=None):
+            self.catalog_iterator = CatalogIterator(catalog, root_path,
+                                                    root_dirent, entry_filter,
+                                                    include_mountpoints = True)
+
+
+    def __init__(self, repository, catalog_hash=None, path=None,
+                       entry_filter=None, cursor=None):
+        """ Iterates the whole repository, the subtree of a catalog given by
+            its hash or the subtree below an arbitrary path. The latter only
+            loads the catalog containing path and the nested catalogs below.
+            An optional DirectoryEntryFilter is evaluated inside the catalogs.
+            A cursor obtained by get_cursor() continues an earlier iteration """
         self.repository    = repository
+        self.entry_filter  = entry_filter
         self.catalog_stack = collections.deque()
+        self.root_catalog  = None
+        if cursor is not None:
+            self._restore(cursor)
+            return
+        if path is not None:
+            self._push_subtree(path)
+            return
         if catalog_hash is None:
             catalog = repository.retrieve_root_catalog()
         else:
@@ -115,11 +151,47 @@ class RepositoryIterator(object):
         return full_path, dirent
 
 
+    def get_cursor(self):
+        """ Compact, JSON serializable position of the iteration
+
+        The cursor holds the hashes of the catalogs currently being iterated
+        (outermost first) and the remaining backlog of each of them. Nested
+        catalogs that were not reached yet are part of those backlogs. Paths
+        are decoded with the recorded path_encoding.
+        """
+        return { 'root_catalog'  : self.root_catalog,
+                 'path_encoding' : _common._PATH_ENCODING,
+                 'catalogs'      : [ (catalog_iterator.catalog.hash,
+                                      [ (path.decode(_common._PATH_ENCODING), matches)
+                                        for path, matches
+                                        in catalog_iterator.catalog_iterator.get_backlog() ])
+                                     for catalog_iterator in self.catalog_stack ] }
+
+
+    def _restore(self, cursor):
+        self.root_catalog = str(cursor['root_catalog'])
+        path_encoding     = cursor.get('path_encoding', 'utf-8')
+        for catalog_hash, backlog in cursor['catalogs']:
+            catalog          = self.repository.retrieve_catalog(str(catalog_hash))
+            catalog_iterator = self._CatalogIterator(catalog,
+                                                     entry_filter = self.entry_filter)
+            catalog_iterator.catalog_iterator.restore_backlog(
+                [ (self._to_str(path, path_encoding), matches)
+                  for path, matches in backlog ])
+            self.catalog_stack.append(catalog_iterator)
+
+
+    @staticmethod
+    def _to_str(path, path_encoding = 'utf-8'):
+        return path.encode(path_encoding) if isinstance(path, unicode) else path
+
+
     def _get_next_dirent(self):
         try:
             return self._get_current_catalog().catalog_iterator.next()
         except StopIteration, e:
-            self._pop_catalog()
+            finished = self._pop_catalog()
+            self.repository.close_catalog(finished.catalog)
             if not self._has_more():
                 raise StopIteration()
             return self._get_next_dirent()
@@ -139,7 +211,23 @@ class RepositoryIterator(object):
 
 
     def _push_catalog(self, catalog):
-        catalog_iterator = self._CatalogIterator(catalog)
+        if self.root_catalog is None:
+            self.root_catalog = catalog.hash
+        catalog_iterator = self._CatalogIterator(catalog,
+                                                 entry_filter = self.entry_filter)
+        self.catalog_stack.append(catalog_iterator)
+
+    def _push_subtree(self, path):
+        real_path = Catalog._canonicalize_path(path)
+        if real_path == "/":
+            real_path = "" # the repository's root entry has an empty path
+        catalog = self.repository.retrieve_catalog_for_path(real_path)
+        dirent  = catalog.find_directory_entry(real_path)
+        if dirent is None:
+            raise FileNotFoundInRepository(path)
+        self.root_catalog = self.repository.manifest.root_catalog
+        catalog_iterator = self._CatalogIterator(catalog, real_path, dirent,
+                                                 self.entry_filter)
         self.catalog_stack.append(catalog_iterator)
 
     def _get_current_catalog(self):
@@ -198,6 +286,80 @@ class CatalogTreeIterator(object):
 
 
 
+class OpenedCatalogs(object):
+    """ Bounded LRU of open Catalogs limited by count and total database size
+
+    Evicted catalogs release their file and database handles. Catalogs with
+    queries still streaming results are skipped by the eviction (limits might
+    be exceeded temporarily), those closed explicitly release their handles
+    once the queries are finished. Catalogs reopen their handles transparently
+    when used again, and the Repository adds them back to the LRU then.
+    """
+
+    def __init__(self, max_count = 256, max_size = 2 * 1024 * 1024 * 1024):
+        self.max_count   = max_count
+        self.max_size    = max_size
+        self._catalogs   = collections.OrderedDict()
+        self._total_size = 0
+
+    def __len__(self):
+        return len(self._catalogs)
+
+    def __contains__(self, catalog_hash):
+        return catalog_hash in self._catalogs
+
+    def total_size(self):
+        return self._total_size
+
+    def get(self, catalog_hash):
+        """ Find an open catalog and mark it as most recently used """
+        entry = self._catalogs.pop(catalog_hash, None)
+        if entry is None:
+            return None
+        self._catalogs[catalog_hash] = entry
+        return entry[0]
+
+    def add(self, catalog):
+        entry = self._catalogs.get(catalog.hash)
+        if entry is not None and entry[0] is catalog:
+            self.get(catalog.hash) # already known, just mark as recently used
+            return
+        self.remove(catalog.hash)
+        db_size = catalog.db_size()
+        self._catalogs[catalog.hash] = (catalog, db_size)
+        self._total_size += db_size
+        self._evict()
+
+    def remove(self, catalog_hash):
+        """ Forget about a catalog and release its handles """
+        entry = self._catalogs.pop(catalog_hash, None)
+        if entry is None:
+            return False
+        catalog, db_size = entry
+        self._total_size -= db_size
+        self.release(catalog)
+        return True
+
+    @staticmethod
+    def release(catalog):
+        """ Close a catalog unless it is memory backed and could not reopen
+            (those are freed once the last reference to them is dropped) """
+        if not catalog.is_memory_backed():
+            catalog.close()
+
+    def _evict(self):
+        while len(self._catalogs) > 1 and                \
+              (len(self._catalogs) > self.max_count or   \
+               self._total_size    > self.max_size):
+            idle = next((catalog_hash for catalog_hash, (catalog, _)
+                                      in self._catalogs.items()[:-1]
+                                      if not catalog.has_active_cursors()), None)
+            if idle is None:
+                break # all in use, evicted on a later addition
+            self.remove(idle)
+
+
+
 class Cache(object):
 
     class TransactionFile(file):
@@ -313,6 +475,42 @@ class Fetcher(object):
         """
         return self._retrieve(file_name, self._retrieve_raw_file)
 
+    def retrieve_raw_file_into(self, file_name, destination_file):
+        """
+        Method to write a raw file from the repository into a given file
+        object without storing it in the cache
+        :param file_name: name of the file in the repository
+        :param destination_file: writable file object
+        """
+        self._retrieve_raw_file(file_name, destination_file)
+
+    def retrieve_cached_file(self, file_name):
+        """
+        Method to retrieve a file from the cache only
+        :param file_name: name of the file in the repository
+        :return: a read-only file object or None if the file is not cached
+        """
+        return self.__cache.get(file_name)
+
+    def retrieve_file_content(self, file_name):
+        """
+        Method to retrieve the decompressed content of a file from the
+        repository without storing it in the cache
+        :param file_name: name of the file in the repository
+        :return: the decompressed file content as a string
+        """
+        return self._fetch_file(file_name)
+
+    def store_file_content(self, file_name, content):
+        """
+        Method to store (already decompressed) content in the cache
+        :param file_name: name of the file in the repository
+        :param content: decompressed file content
+        :return: a file read-only file object that represents the cached file
+        """
+        return self._retrieve(file_name, lambda file_name, cached_file:
+                                             cached_file.write(content))
+
     def _retrieve(self, file_name, retrieve_fn):
         cached_file_ro = self.__cache.get(file_name)
         if not cached_file_ro:
@@ -321,9 +519,12 @@ class Fetcher(object):
             self.__cache.commit(cached_file_rw)
         return self.__cache.get(file_name)
 
-    @abc.abstractmethod
     def _retrieve_file(self, file_name, cached_file):
-        """ Abstract method to retrieve a file from the repository """
+        cached_file.write(self._fetch_file(file_name))
+
+    @abc.abstractmethod
+    def _fetch_file(self, file_name):
+        """ Abstract method to retrieve and decompress a repository file """
         pass
 
     @abc.abstractmethod
@@ -338,13 +539,13 @@ class LocalFetcher(Fetcher):
     def __init__(self, local_repo, cache_dir=''):
         super(LocalFetcher, self).__init__(local_repo, cache_dir)
 
-    def _retrieve_file(self, file_name, cached_file):
+    def _fetch_file(self, file_name):
         full_path = self._make_file_uri(file_name)
         if os.path.exists(full_path):
             compressed_file = open(full_path, 'r')
             decompressed_content = zlib.decompress(compressed_file.read())
             compressed_file.close()
-            cached_file.write(decompressed_content)
+            return decompressed_content
         else:
             raise FileNotFoundInRepository(file_name)
 
@@ -378,17 +579,16 @@ class RemoteFetcher(Fetcher):
             if chunk:
                 cached_file.write(chunk)
 
-    def _download_content_and_decompress(self, cached_file, file_url):
+    def _download_content_and_decompress(self, file_url):
         response = requests.get(file_url, stream=False,
                                           headers=self._default_headers)
         if response.status_code != requests.codes.ok:
             raise FileNotFoundInRepository(file_url)
-        decompressed_content = zlib.decompress(response.content)
-        cached_file.write(decompressed_content)
+        return zlib.decompress(response.content)
 
-    def _retrieve_file(self, file_name, cached_file):
+    def _fetch_file(self, file_name):
         file_url = self._make_file_uri(file_name)
-        self._download_content_and_decompress(cached_file, file_url)
+        return self._download_content_and_decompress(file_url)
 
     def _retrieve_raw_file(self, file_name, cached_file):
         file_url = self._make_file_uri(file_name)
@@ -398,12 +598,24 @@ class RemoteFetcher(Fetcher):
 class Repository(object):
     """ Wrapper around a CVMFS Repository representation """
 
-    def __init__(self, source, cache_dir=''):
+    _mountpoint_map_name = "mountpoints.json"
+    _path_index_name     = "paths.db"
+    _content_index_name  = "contents.db"
+
+    def __init__(self, source, cache_dir='',
+                       max_open_catalogs = 256,
+                       max_open_catalog_size = 2 * 1024 * 1024 * 1024,
+                       in_memory_catalogs = False,
+                       max_in_memory_catalog_size = 512 * 1024 * 1024):
         if source == '':
             raise Exception('source cannot be empty')
         self._fetcher = self.__init_fetcher(source, cache_dir)
         self._storage_location = self._fetcher.get_cache_path()
-        self._opened_catalogs = {}
+        self._in_memory_catalogs = in_memory_catalogs
+        self._max_in_memory_catalog_size = max_in_memory_catalog_size
+        self._opened_catalogs = OpenedCatalogs(max_open_catalogs,
+                                               max_open_catalog_size)
+        self._mountpoint_map = None
         self._read_manifest()
         self._try_to_get_last_replication_timestamp()
         self._try_to_get_replication_state()
@@ -425,6 +637,48 @@ class Repository(object):
         return RepositoryIterator(self)
 
 
+    def iterate_subtree(self, path):
+        """ Iterate all directory entries below (and including) a path """
+        return RepositoryIterator(self, path = path)
+
+
+    def find_entries(self, entry_filter, path = None):
+        """ Iterate all directory entries matching a DirectoryEntryFilter
+            (optionally only below a given path) """
+        if path is None:
+            return RepositoryIterator(self, entry_filter = entry_filter)
+        return RepositoryIterator(self, path = path, entry_filter = entry_filter)
+
+
+    def walk_resumable(self, checkpoint_path, interval = 100000,
+                             entry_filter = None):
+        """ Iterate the repository while checkpointing the position
+
+        Every 'interval' entries the iterator's cursor is persisted to
+        checkpoint_path after the consumer has processed the previous entry.
+        A later walk of the same root catalog continues at the last checkpoint
+        (yielding the entries after it again). The checkpoint is removed once
+        the walk is complete.
+        """
+        checkpoint = WalkCheckpoint(checkpoint_path, self.manifest.root_catalog)
+        cursor     = checkpoint.load()
+        iterator   = RepositoryIterator(self, entry_filter = entry_filter,
+                                              cursor       = cursor)
+        processed  = 0
+        for record in iterator:
+            yield record
+            processed += 1
+            if processed % interval == 0:
+                checkpoint.save(iterator.get_cursor())
+        checkpoint.remove()
+
+
+    def walk_parallel(self, processes = None, batch_size = 10000):
+        """ Walk the repository with a pool of worker processes (unordered) """
+        return ParallelRepositoryWalker(self, processes,
+                                        batch_size = batch_size)
+
+
     def _read_manifest(self):
         try:
             with self._fetcher.retrieve_raw_file(_common._MANIFEST_NAME) as manifest_file:
@@ -483,6 +737,46 @@ class Repository(object):
         return CatalogTreeIterator(self, root_catalog)
 
 
+    def collect_statistics(self, processes = None, per_mountpoint = True):
+        """ Aggregate the catalog statistics of all catalogs in the repository """
+        return collect_statistics(self, processes, per_mountpoint)
+
+
+    def analyze_deduplication(self, top_n = 10, work_dir = None):
+        """ Compare the logical and the unique object size of the repository """
+        return analyze_deduplication(self, top_n, work_dir)
+
+
+    def audit_garbage(self, storage_dir = None, include_tags = True,
+                            work_dir = None, list_objects = False):
+        """ Find objects in the backend storage (the repository's location by
+            default) that are neither referenced by the current revision nor
+            by any tagged revision and return a GarbageReport """
+        if storage_dir is None:
+            if not isinstance(self._fetcher, LocalFetcher):
+                raise ConfigurationNotFound(self, "storage_dir")
+            storage_dir = self._fetcher.source
+        scan = ReachabilityScan(self, include_tags, work_dir)
+        try:
+            return scan.audit(storage_dir, list_objects)
+        finally:
+            scan.close()
+
+
+    def diff(self, old_root_hash, new_root_hash = None, old_repository = None):
+        """ Iterate the differences between two repository revisions
+
+        The old revision's catalogs are taken from old_repository (e.g. a
+        lagging Stratum 1) if given. new_root_hash defaults to the current
+        revision of this repository.
+        """
+        if new_root_hash is None:
+            new_root_hash = self.manifest.root_catalog
+        if old_repository is None:
+            old_repository = self
+        return RepositoryDiff(old_repository, old_root_hash, self, new_root_hash)
+
+
     def has_repository_type(self):
         return hasattr(self, 'type') and self.type != 'unknown'
 
@@ -498,6 +792,50 @@ class Repository(object):
         return History(history_db)
 
 
+    def retrieve_tag_root_catalog(self, tag):
+        """ Open the root catalog of a tagged revision (RevisionTag or name) """
+        if not hasattr(tag, 'hash'):
+            tag_name = tag
+            tag      = self.retrieve_history().get_tag_by_name(tag_name)
+            if tag is None:
+                raise TagNotFound(self, tag_name)
+        return self.retrieve_catalog(tag.hash)
+
+
+    def open_revision(self, tag = None, revision = None, timestamp = None):
+        """ Open a RevisionView of a past revision given by either a tag name,
+            a revision number or a point in time (datetime or UNIX timestamp).
+            Revision numbers without a tag follow the previous revision chain """
+        history = self.retrieve_history() if self.has_history() else None
+        found   = None
+        if tag is not None:
+            found = history.get_tag_by_name(tag) if history else None
+        elif revision is not None:
+            if history:
+                found = next(history.find_tags_by_revision(revision), None)
+            if found is None:
+                root_catalog_hash = self._find_root_catalog_of_revision(revision)
+                if root_catalog_hash is not None:
+                    return RevisionView(self, root_catalog_hash, revision)
+        elif timestamp is not None:
+            found = history.get_tag_at(timestamp) if history else None
+        else:
+            raise ValueError("Either tag, revision or timestamp is needed")
+        if found is None:
+            raise TagNotFound(self, str(tag or revision or timestamp))
+        return RevisionView(self, found.hash, found.revision, found)
+
+
+    def _find_root_catalog_of_revision(self, revision):
+        catalog = self.retrieve_root_catalog()
+        while int(catalog.revision) > revision and catalog.has_predecessor():
+            try:
+                catalog = self.retrieve_catalog(catalog.get_predecessor().hash)
+            except FileNotFoundInRepository, e:
+                return None
+        return catalog.hash if int(catalog.revision) == revision else None
+
+
     def retrieve_whitelist(self):
         """ retrieve and parse the .cvmfswhitelist file from the repository """
         whitelist = self._fetcher.retrieve_raw_file(_common._WHITELIST_NAME)
@@ -512,46 +850,222 @@ class Repository(object):
 
     def retrieve_object(self, object_hash, hash_suffix = ''):
         """ Retrieves an object from the content addressable storage """
-        path = "data/" + object_hash[:2] + "/" + object_hash[2:] + hash_suffix
+        path = self._object_path(object_hash, hash_suffix)
         return self._fetcher.retrieve_file(path)
 
 
+    def retrieve_raw_file_into(self, file_name, destination_file):
+        """ Writes a raw (compressed) repository file into a file object
+            bypassing the cache (e.g. 'data/28/a5cd...13f4C') """
+        self._fetcher.retrieve_raw_file_into(file_name, destination_file)
+
+
+    @staticmethod
+    def _object_path(object_hash, hash_suffix = ''):
+        return "data/" + object_hash[:2] + "/" + object_hash[2:] + hash_suffix
+
+
     def retrieve_root_catalog(self):
         return self.retrieve_catalog(self.manifest.root_catalog)
 
 
     def retrieve_catalog_for_path(self, needle_path):
-        """ Recursively walk down the Catalogs and find the best fit for a path """
-        clg = self.retrieve_root_catalog()
-        while True:
-            new_nested_reference = clg.find_nested_for_path(needle_path)
-            if new_nested_reference is None:
-                break
-            nested_reference = new_nested_reference
-            clg = self.retrieve_catalog(nested_reference.hash)
-        return clg
+        """ Find the Catalog that contains a path using the mountpoint map """
+        mountpoints = self.get_mountpoint_map()
+        nested_reference = mountpoints.find_catalog_reference(needle_path, self)
+        return self.retrieve_catalog(nested_reference.hash)
+
+
+    def find_directory_entries(self, paths):
+        """ Finds the DirectoryEntries for a list of paths (None if not found)
+
+        Paths are grouped by their containing catalog and each catalog is
+        queried once for all of its paths. Results are in input order.
+        """
+        mountpoints   = self.get_mountpoint_map()
+        real_paths    = [ Catalog._canonicalize_path(path) for path in paths ]
+        catalog_paths = collections.defaultdict(list)
+        for idx, real_path in enumerate(real_paths):
+            catalog_ref = mountpoints.find_catalog_reference(real_path, self)
+            catalog_paths[catalog_ref.hash].append(idx)
+
+        dirents = [ None ] * len(real_paths)
+        for catalog_hash, indices in catalog_paths.iteritems():
+            catalog = self.retrieve_catalog(catalog_hash)
+            results = catalog.find_directory_entries([ real_paths[idx]
+                                                       for idx in indices ])
+            for idx, dirent in zip(indices, results):
+                dirents[idx] = dirent
+        return dirents
+
+
+    def get_mountpoint_map(self):
+        """ Get the (cached) MountpointMap of the current repository revision """
+        root_catalog_hash = self.manifest.root_catalog
+        if self._mountpoint_map is None or \
+           not self._mountpoint_map.is_for(root_catalog_hash):
+            self._mountpoint_map = \
+                MountpointMap.load(self._get_mountpoint_map_path(),
+                                   root_catalog_hash)
+        if self._mountpoint_map is None:
+            self._mountpoint_map = MountpointMap(root_catalog_hash,
+                                                 self.manifest.revision)
+        return self._mountpoint_map
+
+
+    def save_mountpoint_map(self):
+        """ Persist the MountpointMap alongside the repository's cache """
+        if self._mountpoint_map is not None:
+            self._mountpoint_map.save(self._get_mountpoint_map_path())
+
+
+    def _get_mountpoint_map_path(self):
+        return os.path.join(self._storage_location, self._mountpoint_map_name)
+
+
+    def get_path_index(self, index_path = None):
+        """ Opens the PathIndex (in the cache by default) and makes sure that
+            it contains the current revision, indexing changed catalogs """
+        if index_path is None:
+            index_path = os.path.join(self._storage_location,
+                                      self._path_index_name)
+        path_index = PathIndex(index_path)
+        path_index.index_revision(self, self.manifest.root_catalog)
+        return path_index
+
+
+    def search_paths(self, substring, index_path = None):
+        """ Lists all paths of the current revision containing a substring """
+        path_index = self.get_path_index(index_path)
+        paths      = list(path_index.search(self.manifest.root_catalog, substring))
+        path_index.close()
+        return paths
+
+
+    def glob_paths(self, pattern, index_path = None):
+        """ Lists all paths of the current revision matching a glob pattern """
+        path_index = self.get_path_index(index_path)
+        paths      = list(path_index.glob(self.manifest.root_catalog, pattern))
+        path_index.close()
+        return paths
+
+
+    def get_content_index(self, index_path = None):
+        """ Opens the ContentIndex (in the cache by default) and makes sure that
+            it contains the current revision, indexing changed catalogs """
+        if index_path is None:
+            index_path = os.path.join(self._storage_location,
+                                      self._content_index_name)
+        content_index = ContentIndex(index_path)
+        content_index.index_revision(self, self.manifest.root_catalog)
+        return content_index
+
+
+    def find_paths_by_content(self, content_hashes, index_path = None):
+        """ Maps each of the given content hashes to the paths referencing it
+            in the current revision (including chunked files by chunk hash) """
+        content_index = self.get_content_index(index_path)
+        references    = content_index.lookup_many(content_hashes,
+                                                  self.manifest.root_catalog)
+        content_index.close()
+        paths = {}
+        for content_hash, content_references in references.iteritems():
+            paths[content_hash] = sorted(set(
+                [ self.retrieve_catalog(reference.catalog_hash)
+                      .find_path_split_md5(*reference.path_hash())
+                  for reference in content_references ]))
+        return paths
 
 
     def close_catalog(self, catalog):
-        try:
-            del self._opened_catalogs[catalog.hash]
-        except KeyError, e:
-            print "not found:" , catalog.hash
-            pass
+        """ Release the handles of a catalog (it reopens them when used) """
+        if not self._opened_catalogs.remove(catalog.hash):
+            OpenedCatalogs.release(catalog)
 
 
     def retrieve_catalog(self, catalog_hash):
         """ Download and open a catalog from the repository """
-        if catalog_hash in self._opened_catalogs:
-            return self._opened_catalogs[catalog_hash]
+        catalog = self._opened_catalogs.get(catalog_hash)
+        if catalog is not None:
+            return catalog
         return self._retrieve_and_open_catalog(catalog_hash)
 
+    def _detach_opened_catalogs(self):
+        """ Start over with an empty set of open catalogs in a forked process
+            without closing the parent's sqlite handles (kept alive here) """
+        self._inherited_catalogs = self._opened_catalogs
+        self._opened_catalogs    = OpenedCatalogs(self._opened_catalogs.max_count,
+                                                  self._opened_catalogs.max_size)
+
     def _retrieve_and_open_catalog(self, catalog_hash):
-        catalog_file = self.retrieve_object(catalog_hash, 'C')
-        new_catalog = Catalog(catalog_file, catalog_hash)
-        self._opened_catalogs[catalog_hash] = new_catalog
+        if self._in_memory_catalogs:
+            new_catalog = self._open_catalog_in_memory(catalog_hash)
+        else:
+            catalog_file = self.retrieve_object(catalog_hash, 'C')
+            new_catalog = Catalog(catalog_file, catalog_hash)
+        self._track_catalog(new_catalog)
+        self._opened_catalogs.add(new_catalog)
         return new_catalog
 
+    def _track_catalog(self, catalog):
+        """ Put catalogs back into the LRU of opened catalogs when they reopen
+            after being evicted (a weak reference avoids reference cycles) """
+        owner = weakref.ref(self)
+        def reopened(reopened_catalog):
+            repository = owner()
+            if repository is not None:
+                repository._opened_catalogs.add(reopened_catalog)
+        catalog.on_reopen = reopened
+
+    def _open_catalog_in_memory(self, catalog_hash):
+        """ Open a catalog without storing it in the cache directory unless it
+            is cached already or doesn't fit into memory (fallback to disk) """
+        path = self._object_path(catalog_hash, 'C')
+        catalog_file = self._fetcher.retrieve_cached_file(path)
+        if catalog_file:
+            return Catalog(catalog_file, catalog_hash)
+        content = self._fetcher.retrieve_file_content(path)
+        if len(content) > self._max_in_memory_catalog_size or \
+           len(content) > self._available_memory():
+            catalog_file = self._fetcher.store_file_content(path, content)
+            return Catalog(catalog_file, catalog_hash)
+        return Catalog.from_buffer(content, catalog_hash)
+
+    @staticmethod
+    def _available_memory():
+        if not os.path.isdir(_common._MEMORY_BACKED_DIR):
+            return 0
+        stat = os.statvfs(_common._MEMORY_BACKED_DIR)
+        return stat.f_bavail * stat.f_frsize
+
+
+class RevisionView(Repository):
+    """ Read-only view of a Repository at a past revision
+
+    The view shares the fetcher (i.e. the object cache) and the opened
+    catalogs with the live Repository. Only the manifest's root catalog and
+    revision are replaced, thus iteration, lookups, catalogs() and all other
+    Repository methods operate on the past revision.
+    """
+
+    def __init__(self, repository, root_catalog_hash, revision, tag = None):
+        self.__dict__.update(repository.__dict__)
+        self.live_repository       = repository
+        self.tag                   = tag
+        self.manifest              = copy.copy(repository.manifest)
+        self.manifest.root_catalog = root_catalog_hash
+        self.manifest.revision     = revision
+        self._mountpoint_map       = None
+        self._mountpoint_map_name  = "mountpoints." + root_catalog_hash + ".json"
+
+    def __str__(self):
+        return "<RevisionView " + self.fqrn + " @ " + \
+               str(self.manifest.revision) + ">"
+
+    def __repr__(self):
+        return self.__str__()
+
+
 
 def all_local():
     d = _common._REPO_CONFIG_PATH
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+"""
+
+import _worker
+
+
+class RepositoryStatistics:
+    """ Aggregates the catalog statistics of a whole repository revision
+
+    Counters are dictionaries keyed by CatalogStatistics.counter_names. The
+    'mountpoints' dictionary maps the root path of every catalog to its own
+    counters (i.e. without nested catalogs), 'total' holds the repository
+    wide sums.
+    """
+
+    def __init__(self, root_catalog_hash):
+        self.root_catalog = root_catalog_hash
+        self.mountpoints  = {}
+        self.total        = {}
+
+    def __str__(self):
+        return "<RepositoryStatistics for " + self.root_catalog + ">"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    def num_catalogs(self):
+        return len(self.mountpoints)
+
+    def num_entries(self):
+        return self.total.get('regular', 0) + \
+               self.total.get('dir',     0) + \
+               self.total.get('symlink', 0)
+
+    def data_size(self):
+        return self.total.get('file_size', 0)
+
+    def subtree_counters(self, mountpoint):
+        """ sums up the counters of a mountpoint and all catalogs below it """
+        prefix   = mountpoint.rstrip('/') + '/'
+        counters = {}
+        for path, path_counters in self.mountpoints.iteritems():
+            if path == mountpoint or path.startswith(prefix):
+                self._accumulate(counters, path_counters)
+        return counters
+
+
+    def _add(self, mountpoint, counters):
+        self.mountpoints[mountpoint] = counters
+        self._accumulate(self.total, counters)
+
+    @staticmethod
+    def _accumulate(sums, counters):
+        for name, value in counters.iteritems():
+            sums[name] = sums.get(name, 0) + value
+
+
+
+def _summarize_catalog(catalog_hash):
+    """ Opens a catalog in a worker process and sends back picklable results """
+    catalog = _worker.repository.retrieve_catalog(catalog_hash)
+    _worker.schedule([ nested_ref.hash for nested_ref in catalog.list_nested() ])
+    _worker.emit((catalog.root_prefix, catalog.get_statistics().get_counters()))
+    _worker.repository.close_catalog(catalog)
+
+
+def collect_statistics(repository, processes = None, per_mountpoint = True):
+    """ Collect the RepositoryStatistics of the repository's current revision
+
+    Without per_mountpoint only the root catalog is opened and its subtree
+    counters are used as repository totals. Otherwise every catalog is opened
+    using a pool of worker processes (all CPUs by default). With processes=1
+    the catalogs are opened in this process through a CatalogTreeIterator.
+    """
+    root_catalog = repository.retrieve_root_catalog()
+    statistics   = RepositoryStatistics(root_catalog.hash)
+    if not per_mountpoint:
+        root_statistics  = root_catalog.get_statistics()
+        statistics.total = root_statistics.get_subtree_counters()
+        return statistics
+
+    if processes == 1:
+        for catalog in repository.catalogs(root_catalog):
+            statistics._add(catalog.root_prefix,
+                            catalog.get_statistics().get_counters())
+        return statistics
+
+    statistics._add(root_catalog.root_prefix,
+                    root_catalog.get_statistics().get_counters())
+    nested_hashes = [ nested_ref.hash for nested_ref in root_catalog.list_nested() ]
+    for mountpoint, counters in _worker.imap_tree(processes, repository,
+                                                  _summarize_catalog,
+                                                  nested_hashes):
+        statistics._add(mountpoint, counters)
+    return statistics
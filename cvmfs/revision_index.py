@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Base class of local sqlite indexes over the catalogs of repository revisions.
+Catalogs are content addressed, hence a catalog that was indexed for an
+earlier revision is shared with all later revisions referring to it and only
+new or changed catalogs are read when another revision is added.
+"""
+
+import collections
+import sqlite3
+
+
+class RevisionIndex:
+    """ Keeps track of indexed catalogs and the revisions they belong to
+
+    Subclasses create their own tables in _create_tables(), fill them with
+    the content of a single catalog in _index_catalog_content() and remove
+    that content again in _forget_catalog_content().
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._db_handle = sqlite3.connect(index_path)
+        self._db_handle.text_factory = str
+        self._create_revision_tables()
+        self._create_tables()
+
+
+    def __str__(self):
+        return "<" + self.__class__.__name__ + " " + self.index_path + ">"
+
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    def close(self):
+        self._db_handle.close()
+
+
+    def has_revision(self, root_catalog_hash):
+        res = self._db_handle.execute("SELECT count(*) FROM revisions      \
+                                       WHERE root_catalog = ?;",
+                                      (root_catalog_hash,)).fetchone()
+        return res[0] > 0
+
+
+    def index_revision(self, repository, root_catalog_hash):
+        """ Index a repository revision given by its root catalog hash
+
+        Returns the number of catalogs that had to be opened and indexed, all
+        other catalogs (and their subtrees) were already part of the index.
+        """
+        if self.has_revision(root_catalog_hash):
+            return 0
+        indexed_catalogs = 0
+        pending          = collections.deque([ root_catalog_hash ])
+        revision         = set()
+        with self._db_handle:
+            while pending:
+                catalog_hash = pending.pop()
+                revision.add(catalog_hash)
+                nested = self._list_nested(catalog_hash)
+                if nested is None:
+                    nested = self._index_catalog(repository, catalog_hash)
+                    indexed_catalogs += 1
+                pending.extend(nested)
+            self._db_handle.executemany("INSERT INTO revisions VALUES (?, ?);",
+                                        [ (root_catalog_hash, catalog_hash)
+                                          for catalog_hash in revision ])
+        return indexed_catalogs
+
+
+    def forget_revision(self, root_catalog_hash):
+        """ Remove a revision and all catalogs no other revision refers to """
+        with self._db_handle:
+            self._db_handle.execute("DELETE FROM revisions WHERE root_catalog = ?;",
+                                    (root_catalog_hash,))
+            orphans = [ row[0] for row in self._db_handle.execute(
+                                "SELECT hash FROM catalogs WHERE hash NOT IN \
+                                   (SELECT catalog FROM revisions);") ]
+            for catalog_hash in orphans:
+                self._forget_catalog_content(catalog_hash)
+                self._db_handle.execute("DELETE FROM nested WHERE parent = ?;",
+                                        (catalog_hash,))
+                self._db_handle.execute("DELETE FROM catalogs WHERE hash = ?;",
+                                        (catalog_hash,))
+
+
+    def _create_tables(self):
+        pass
+
+    def _index_catalog_content(self, catalog):
+        pass
+
+    def _forget_catalog_content(self, catalog_hash):
+        pass
+
+
+    def _create_revision_tables(self):
+        self._db_handle.execute("CREATE TABLE IF NOT EXISTS catalogs           \
+                                   (hash TEXT PRIMARY KEY, mountpoint TEXT);")
+        self._db_handle.execute("CREATE TABLE IF NOT EXISTS nested             \
+                                   (parent TEXT, child TEXT,                   \
+                                    PRIMARY KEY (parent, child));")
+        self._db_handle.execute("CREATE TABLE IF NOT EXISTS revisions          \
+                                   (root_catalog TEXT, catalog TEXT,           \
+                                    PRIMARY KEY (root_catalog, catalog));")
+        self._db_handle.execute("CREATE INDEX IF NOT EXISTS revisions_catalog  \
+                                   ON revisions (catalog);")
+
+
+    def _list_nested(self, catalog_hash):
+        """ Nested catalog hashes of an indexed catalog (None if not indexed) """
+        known = self._db_handle.execute("SELECT count(*) FROM catalogs          \
+                                         WHERE hash = ?;",
+                                        (catalog_hash,)).fetchone()
+        if known[0] == 0:
+            return None
+        return [ row[0] for row in self._db_handle.execute(
+                                    "SELECT child FROM nested WHERE parent = ?;",
+                                    (catalog_hash,)) ]
+
+
+    def _index_catalog(self, repository, catalog_hash):
+        catalog = repository.retrieve_catalog(catalog_hash)
+        nested  = [ nested_ref.hash for nested_ref in catalog.list_nested() ]
+        self._index_catalog_content(catalog)
+        self._db_handle.executemany("INSERT INTO nested VALUES (?, ?);",
+                                    [ (catalog_hash, nested_hash)
+                                      for nested_hash in nested ])
+        self._db_handle.execute("INSERT INTO catalogs VALUES (?, ?);",
+                                (catalog_hash, catalog.root_prefix))
+        repository.close_catalog(catalog)
+        return nested
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Traverses many revisions of a repository at once. Consecutive revisions share
+most of their nested catalogs (identified by their content hash), so every
+distinct catalog is opened and evaluated once and its result is reused for
+all revisions referring to it. Results of whole catalog subtrees are cached
+as well, thus the cost is proportional to the number of distinct catalogs.
+"""
+
+import collections
+import copy
+
+from repository import FileNotFoundInRepository
+
+
+class MultiRevisionWalker:
+    """ Evaluates a function on the distinct catalogs of many revisions
+
+    visitor(catalog) is called once per distinct catalog hash and its results
+    are kept in catalog_results. The result of a revision starts with a copy
+    of initial and is merged with combine(value, catalog_value) for all of
+    its catalogs (combine must not modify its second argument).
+    """
+
+    def __init__(self, repository, visitor, combine, initial):
+        self.repository      = repository
+        self.visitor         = visitor
+        self.combine         = combine
+        self.initial         = initial
+        self.catalog_results = {}
+        self.opened_catalogs = 0
+        self._nested         = {}
+        self._predecessors   = {}
+        self._subtrees       = {}
+
+
+    def walk(self, root_catalog_hashes):
+        """ Yields (root catalog hash, revision result) for the given roots """
+        for root_catalog_hash in root_catalog_hashes:
+            yield root_catalog_hash, self._subtree_result(root_catalog_hash)
+
+
+    def walk_history(self, max_revisions = None, root_catalog_hash = None):
+        """ Walks the chain of previous revisions starting at root_catalog_hash
+            (the current revision by default) until max_revisions are visited
+            or a predecessor is no longer available """
+        if root_catalog_hash is None:
+            root_catalog_hash = self.repository.manifest.root_catalog
+        visited = 0
+        while root_catalog_hash is not None and \
+              (max_revisions is None or visited < max_revisions):
+            try:
+                result = self._subtree_result(root_catalog_hash)
+            except FileNotFoundInRepository, e:
+                return # garbage collected revision
+            yield root_catalog_hash, result
+            root_catalog_hash = self._predecessors[root_catalog_hash]
+            visited += 1
+
+
+    def walk_tags(self):
+        """ Walks all revisions referred to by a History tag (newest first) """
+        history = self.repository.retrieve_history()
+        roots   = []
+        for tag in history:
+            if tag.hash not in roots:
+                roots.append(tag.hash)
+        return self.walk(roots)
+
+
+    def revision_catalogs(self, root_catalog_hash):
+        """ Lists the hashes of all catalogs of a visited revision """
+        catalogs = []
+        pending  = collections.deque([ root_catalog_hash ])
+        while pending:
+            catalog_hash = pending.pop()
+            catalogs.append(catalog_hash)
+            pending.extend(self._nested[catalog_hash])
+        return catalogs
+
+
+    def _subtree_result(self, root_catalog_hash):
+        """ Result of a catalog and all nested catalogs below it (post-order) """
+        pending = [ (root_catalog_hash, False) ]
+        while pending:
+            catalog_hash, children_done = pending.pop()
+            if catalog_hash in self._subtrees:
+                continue
+            if not children_done:
+                self._visit(catalog_hash)
+                pending.append((catalog_hash, True))
+                pending.extend([ (nested_hash, False)
+                                 for nested_hash in self._nested[catalog_hash] ])
+                continue
+            result = self.combine(copy.deepcopy(self.initial),
+                                  self.catalog_results[catalog_hash])
+            for nested_hash in self._nested[catalog_hash]:
+                result = self.combine(result, self._subtrees[nested_hash])
+            self._subtrees[catalog_hash] = result
+        return self._subtrees[root_catalog_hash]
+
+
+    def _visit(self, catalog_hash):
+        if catalog_hash in self.catalog_results:
+            return
+        catalog = self.repository.retrieve_catalog(catalog_hash)
+        self.opened_catalogs += 1
+        self.catalog_results[catalog_hash] = self.visitor(catalog)
+        self._nested[catalog_hash] = [ nested_ref.hash
+                                       for nested_ref in catalog.list_nested() ]
+        predecessor = catalog.get_predecessor()
+        self._predecessors[catalog_hash] = predecessor.hash if predecessor \
+                                                            else None
+        self.repository.close_catalog(catalog)
@@ -22,6 +22,7 @@ binary string containing the private-key signature terminated by EOF.
 """
 
 import abc
+import cStringIO
 import hashlib
 
 class IncompleteRootFileSignature(Exception):
@@ -48,17 +49,24 @@ class RootFile:
 
     @abc.abstractmethod
     def __init__(self, file_object):
-        """ Initializes a root file object from a file pointer """
+        """ Initializes a root file object from a file pointer or directly
+            from an in-memory string (e.g. the body of an HTTP response).
+            The key-value lines are parsed and hashed in a single pass """
+        if isinstance(file_object, (str, buffer, bytearray)):
+            file_object = cStringIO.StringIO(str(file_object))
         self.has_signature = False
-        for line in file_object.readlines():
+        hash_sum = hashlib.sha1()
+        while True:
+            line = file_object.readline()
             if len(line) == 0:
-                continue
+                break
             if line[0:2] == "--":
                 self.has_signature = True
                 break
+            hash_sum.update(line)
             self._read_line(line)
         if self.has_signature:
-            self._read_signature(file_object)
+            self._read_signature(file_object, hash_sum.hexdigest())
         self._check_validity()
 
     @abc.abstractmethod
@@ -70,26 +78,9 @@ class RootFile:
         return self.has_signature and self._verify_signature(public_entity)
 
 
-    @staticmethod
-    def _hash_over_content(file_object):
-        pos = file_object.tell()
-        hash_sum = hashlib.sha1()
-        while True:
-            line = file_object.readline()
-            if line[0:2] == "--":
-                break
-            if pos == file_object.tell():
-                raise IncompleteRootFileSignature("Signature not found")
-            hash_sum.update(line)
-            pos = file_object.tell()
-        return hash_sum.hexdigest()
-
-
-    def _read_signature(self, file_object):
-        """ Reads the signature's checksum and the binary signature string """
-        file_object.seek(0)
-        message_digest = self._hash_over_content(file_object)
-
+    def _read_signature(self, file_object, message_digest):
+        """ Reads the signature's checksum and the binary signature string
+            following the termination line """
         self.signature_checksum = file_object.readline().rstrip()
         if len(self.signature_checksum) != 40:
             raise IncompleteRootFileSignature("Signature checksum malformed")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+"""
+
+import os
+import unittest
+import sqlite3
+from mock_repository import MockRepository
+
+import cvmfs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.mock_repo = MockRepository()
+        self.repo      = cvmfs.open_repository(self.mock_repo.dir)
+
+    def tearDown(self):
+        del self.repo
+        del self.mock_repo
+
+
+    def test_catalog_is_read_only(self):
+        root_catalog = self.repo.retrieve_root_catalog()
+        self.assertRaises(sqlite3.OperationalError,
+                          root_catalog.run_sql,
+                          "DELETE FROM catalog;")
+        self.assertTrue(root_catalog.find_directory_entry("/bar") is not None)
+
+
+    def test_reopen_purged_catalog(self):
+        root_catalog = self.repo.retrieve_root_catalog()
+        db_path      = root_catalog._file.name
+        root_catalog.close()
+        os.unlink(db_path)
+        self.assertRaises(sqlite3.OperationalError,
+                          root_catalog.run_sql, "SELECT count(*) FROM catalog;")
+        self.assertFalse(os.path.exists(db_path))
+
+
+    def test_catalog_sqlite_tuning(self):
+        root_catalog = self.repo.retrieve_root_catalog()
+        mmap_size    = root_catalog.run_sql("PRAGMA mmap_size;")[0][0]
+        cache_size   = root_catalog.run_sql("PRAGMA cache_size;")[0][0]
+        self.assertEqual(cvmfs.Catalog.mmap_size,  mmap_size)
+        self.assertEqual(cvmfs.Catalog.cache_size, cache_size)
+
+
+    def test_find_nested_for_path(self):
+        root_catalog = self.repo.retrieve_root_catalog()
+        self.assertEqual("/bar/1",
+                         root_catalog.find_nested_for_path("/bar/1").root_path)
+        self.assertEqual("/bar/3",
+                         root_catalog.find_nested_for_path("/bar/3/2/bar").root_path)
+        self.assertEqual("/foo",
+                         root_catalog.find_nested_for_path("/foo/").root_path)
+        self.assertEqual(None, root_catalog.find_nested_for_path("/bar/10"))
+        self.assertEqual(None, root_catalog.find_nested_for_path("/foobar"))
+        self.assertEqual(None, root_catalog.find_nested_for_path("/bar"))
+        self.assertEqual(None, root_catalog.find_nested_for_path("/"))
+
+
+    def test_find_entries(self):
+        root_catalog = self.repo.retrieve_root_catalog()
+        directories  = cvmfs.DirectoryEntryFilter(
+                                    flags = cvmfs.DirectoryEntryFilter.Directory)
+        whole      = [ path for path, _ in root_catalog.find_entries(directories) ]
+        below_root = [ path for path, _ in root_catalog.find_entries(directories, "/") ]
+        self.assertEqual(sorted(whole), sorted(below_root))
+        self.assertTrue("/bar" in below_root)
+        self.assertRaises(cvmfs.PathNotFoundInCatalog,
+                          root_catalog.find_entries, directories, "/nonexistent")
+
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_read_columns(self):
+        catalog = self.repo.retrieve_catalog_for_path("/bar/3")
+        columns = catalog.read_columns(batch_size = 2)
+        dirents = dict([ (dirent.path_hash(), dirent)
+                         for _, dirent in catalog ])
+        self.assertEqual(len(dirents), len(columns['size']))
+        self.assertEqual(len(dirents) + 1, len(columns['name_offsets']))
+        for i in range(len(columns['size'])):
+            dirent = dirents[tuple(columns['md5path'][i])]
+            begin, end = columns['name_offsets'][i:i + 2]
+            self.assertEqual(dirent.name,
+                             columns['name_bytes'][begin:end].tostring())
+            self.assertEqual(dirent.size,  columns['size'][i])
+            self.assertEqual(dirent.mtime, columns['mtime'][i])
+            self.assertEqual(dirent.mode,  columns['mode'][i])
+            self.assertEqual(dirent.flags, columns['flags'][i])
+            self.assertEqual(dirent.parent_hash(), tuple(columns['parent'][i]))
+
+
+    def test_catalog_diff(self):
+        new_catalog = self.repo.retrieve_root_catalog()
+        old_catalog = new_catalog.get_predecessor().retrieve_from(self.repo)
+        differences = list(old_catalog.diff(new_catalog))
+        added       = [ d.get_dirent().name for d in differences if d.is_added()    ]
+        removed     = [ d.get_dirent().name for d in differences if d.is_removed()  ]
+        modified    = [ d.get_dirent().name for d in differences if d.is_modified() ]
+        self.assertEqual([ '.cvmfsdirtab' ], added)
+        self.assertEqual([], removed)
+        self.assertEqual([ '1', '2', '3', '4' ], sorted(modified))
+        for difference in differences:
+            if difference.is_modified():
+                self.assertEqual(('mtime',), difference.changed_fields)
+        self.assertEqual([], list(new_catalog.diff(new_catalog)))
+        reverse = list(new_catalog.diff(old_catalog))
+        self.assertEqual([ '.cvmfsdirtab' ],
+                         [ d.get_dirent().name for d in reverse if d.is_removed() ])
+
+
+    def test_directory_entry(self):
+        root_catalog = self.repo.retrieve_root_catalog()
+        big   = root_catalog.find_directory_entry("/bar/big")
+        hello = root_catalog.find_directory_entry("/bar/hello_world")
+        self.assertFalse(hasattr(hello, '__dict__'))
+        self.assertEqual("ff049c626904064d641feca0e9936e5b211807c6",
+                         hello.content_hash_string())
+        self.assertEqual(cvmfs.dirent.ContentHashTypes.Sha1,
+                         hello.content_hash_type)
+        self.assertFalse(hello.has_chunks())
+        self.assertEqual([], hello.chunks)
+        self.assertTrue(big.is_chunked_file())
+        self.assertTrue(big.has_chunks())
+        self.assertEqual(2, len(big.chunks))
+        self.assertEqual(big.size, sum([ chunk.size for chunk in big.chunks ]))
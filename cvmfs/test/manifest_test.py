@@ -278,6 +278,16 @@ class TestManifest(unittest.TestCase):
                           cvmfs.Manifest, self.incomplete_signature)
 
 
+    def test_manifest_from_string(self):
+        content  = self.sane_manifest.getvalue()
+        manifest = cvmfs.Manifest(content)
+        cert     = cvmfs.Certificate(open(self.certificate_file))
+        self.assertEqual(cvmfs.Manifest(self.sane_manifest).root_catalog,
+                         manifest.root_catalog)
+        self.assertTrue(manifest.verify_signature(cert))
+        self.assertTrue(cvmfs.Manifest(buffer(content)).verify_signature(cert))
+
+
     def test_verify_signature(self):
         manifest = cvmfs.Manifest(self.sane_manifest)
         cert = cvmfs.Certificate(open(self.certificate_file))
@@ -30,3 +30,23 @@ class TestMD5Handling(unittest.TestCase):
         path_md5 = hashlib.md5(self.path)
         self.assertEqual(path_md5.digest(), digest)
 
+
+
+    def test_md5_combination_unsigned(self):
+        unsigned_hi = self.path_md5_hi + 2**64
+        digest = cvmfs._combine_md5(self.path_md5_lo, unsigned_hi)
+        self.assertEqual(hashlib.md5(self.path).digest(), digest)
+
+
+    def test_path_hasher(self):
+        hasher = cvmfs.PathHasher(memo_size = 2)
+        md5path = (self.path_md5_lo, self.path_md5_hi)
+        self.assertEqual(md5path, hasher.split_md5(self.path))
+        self.assertEqual(md5path, hasher.split_md5(self.path)) # memoized
+        self.assertEqual(md5path, hasher.split_md5(self.path + "/"))
+        paths    = [ "/", "", "/foo/bar", self.path, "/foo/../foo/bar" ]
+        expected = [ cvmfs._split_md5(hashlib.md5(path).digest())
+                     for path in [ "/", "", "/foo/bar", self.path, "/foo/bar" ] ]
+        self.assertEqual(expected, hasher.split_md5_many(paths))
+        self.assertEqual(expected, hasher.split_md5_many(paths))
+        self.assertEqual([], hasher.split_md5_many([]))
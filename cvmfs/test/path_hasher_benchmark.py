@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+
+Micro benchmark of the path hashing done for every catalog lookup. It is not
+part of the unit tests, run it with: python -m cvmfs.test.path_hasher_benchmark
+"""
+
+import hashlib
+import timeit
+
+import cvmfs
+from cvmfs._common import _canonicalize_path
+
+
+def _split_md5_bytewise(md5digest):
+    """ reference: the per-byte conversion used before struct unpacking """
+    lo = hi = 0
+    for i in range(8):
+        lo |= ord(md5digest[i])     << (i * 8)
+        hi |= ord(md5digest[i + 8]) << (i * 8)
+    if lo >= 2**63: lo -= 2**64
+    if hi >= 2**63: hi -= 2**64
+    return lo, hi
+
+
+def run(num_paths = 10000, repetitions = 5):
+    paths = [ "/software/releases/v%d/lib%d/file%d.so" % (i % 97, i % 13, i)
+              for i in range(num_paths) ]
+
+    def bytewise():
+        for path in paths:
+            _split_md5_bytewise(hashlib.md5(_canonicalize_path(path)).digest())
+
+    def unpacked():
+        for path in paths:
+            cvmfs._split_md5(hashlib.md5(_canonicalize_path(path)).digest())
+
+    def hasher_misses():
+        hasher = cvmfs.PathHasher(memo_size = num_paths / 4)
+        for path in paths:
+            hasher.split_md5(path)
+
+    warm_hasher = cvmfs.PathHasher(memo_size = num_paths)
+    warm_hasher.split_md5_many(paths)
+    def hasher_hits():
+        for path in paths:
+            warm_hasher.split_md5(path)
+
+    for name, function in [ ("bytewise split",        bytewise),
+                            ("struct split",          unpacked),
+                            ("PathHasher (misses)",   hasher_misses),
+                            ("PathHasher (hits)",     hasher_hits) ]:
+        seconds = timeit.timeit(function, number = repetitions)
+        print "%-22s %6.3fs for %d x %d paths" % (name, seconds,
+                                                   repetitions, num_paths)
+
+
+if __name__ == '__main__':
+    run()
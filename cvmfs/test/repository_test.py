@@ -5,11 +5,17 @@ Created by René Meusel
 This file is part of the CernVM File System auxiliary tools.
 """
 
+import datetime
+import os
+import time
 import unittest
+from dateutil.tz     import tzutc
 from file_sandbox    import FileSandbox
 from mock_repository import MockRepository
 
 import cvmfs
+from cvmfs.catalog        import CatalogReference
+from cvmfs.mountpoint_map import MountpointMap
 
 
 class TestRepositoryWrapper(unittest.TestCase):
@@ -95,3 +101,504 @@ class TestRepositoryWrapper(unittest.TestCase):
         self.assertRaises(cvmfs.RepositoryVerificationFailed,
                           cvmfs.open_repository,
                           self.mock_repo.dir, self.mock_repo.public_key)
+
+
+    def test_retrieve_catalog_for_path(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        self.assertEqual("/bar/3",
+                         repo.retrieve_catalog_for_path("/bar/3/2/bar").root_prefix)
+        self.assertEqual("/bar/1",
+                         repo.retrieve_catalog_for_path("/bar/1").root_prefix)
+        self.assertEqual("/",
+                         repo.retrieve_catalog_for_path("/bar/10").root_prefix)
+        self.assertEqual("/",
+                         repo.retrieve_catalog_for_path("/foobar").root_prefix)
+
+
+    def test_persistent_mountpoint_map(self):
+        cache_dir = self.sandbox.temporary_dir
+        repo1 = cvmfs.Repository(self.mock_repo.dir, cache_dir)
+        repo1.retrieve_catalog_for_path("/bar/4/foo")
+        repo1.save_mountpoint_map()
+
+        repo2 = cvmfs.Repository(self.mock_repo.dir, cache_dir)
+        mountpoints = repo2.get_mountpoint_map()
+        self.assertTrue(mountpoints.is_for(repo2.manifest.root_catalog))
+        self.assertEqual(len(repo1.get_mountpoint_map()), len(mountpoints))
+        self.assertEqual("/bar/4",
+                         repo2.retrieve_catalog_for_path("/bar/4/foo").root_prefix)
+
+
+    def test_mountpoint_map_encoding(self):
+        map_path    = os.path.join(self.sandbox.temporary_dir, "mountpoints")
+        mountpoints = MountpointMap("a" * 40)
+        mountpoints._expand(CatalogReference("/", "a" * 40),
+                            [ CatalogReference("/caf\xc3\xa9", "b" * 40),
+                              CatalogReference("/raw\xff",     "c" * 40) ])
+        mountpoints.save(map_path)
+        loaded = MountpointMap.load(map_path, "a" * 40)
+        self.assertEqual(3, len(loaded))
+        self.assertEqual("b" * 40, loaded._references["/caf\xc3\xa9"].hash)
+        self.assertEqual("c" * 40, loaded._references["/raw\xff"].hash)
+
+
+    def test_collect_statistics(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        shortcut   = repo.collect_statistics(per_mountpoint = False)
+        sequential = repo.collect_statistics(processes = 1)
+        parallel   = repo.collect_statistics(processes = 2)
+        self.assertEqual(6, sequential.num_catalogs())
+        self.assertEqual(6, parallel.num_catalogs())
+        self.assertEqual(sequential.mountpoints, parallel.mountpoints)
+        self.assertEqual(sequential.total, parallel.total)
+        self.assertEqual(15, shortcut.total['regular'])
+        self.assertEqual(15, parallel.total['regular'])
+        self.assertEqual(shortcut.data_size(), parallel.data_size())
+        bar3 = parallel.subtree_counters("/bar/3")
+        self.assertEqual(4, bar3['regular'])
+        self.assertEqual(12, bar3['file_size'])
+        bar = parallel.subtree_counters("/bar")
+        self.assertEqual(10, bar['regular'])
+
+
+    def test_repository_diff(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        previous_root = repo.retrieve_root_catalog().get_predecessor().hash
+        diff        = repo.diff(previous_root)
+        differences = list(diff)
+        added_nested = set([ mountpoint for mountpoint, d in differences
+                                        if d.is_added() and mountpoint != "/" ])
+        self.assertEqual(set([ "/bar/1", "/bar/2", "/bar/3", "/bar/4" ]),
+                         added_nested)
+        self.assertEqual(5, diff.compared_catalogs)
+        self.assertEqual(1, diff.skipped_catalogs) # unchanged /foo
+
+        unchanged = repo.diff(repo.manifest.root_catalog)
+        self.assertEqual([], list(unchanged))
+        self.assertEqual(0, unchanged.compared_catalogs)
+
+
+    def test_find_directory_entries(self):
+        repo  = cvmfs.open_repository(self.mock_repo.dir)
+        paths = [ "/bar/3/1/bar", "/bar/nonexistent", "/bar/author",
+                  "/bar/1", "/foobar", "/bar/3/1/bar", "" ]
+        dirents = repo.find_directory_entries(paths)
+        self.assertEqual(len(paths), len(dirents))
+        self.assertEqual("bar",    dirents[0].name)
+        self.assertEqual(None,     dirents[1])
+        self.assertEqual("author", dirents[2].name)
+        self.assertEqual("1",      dirents[3].name)
+        self.assertTrue(dirents[3].is_nested_catalog_root())
+        self.assertEqual(None,     dirents[4])
+        self.assertEqual(dirents[0].path_hash(), dirents[5].path_hash())
+        self.assertTrue(dirents[6].is_directory())
+
+
+    def test_bounded_opened_catalogs(self):
+        repo = cvmfs.Repository(self.mock_repo.dir, max_open_catalogs = 2)
+        catalogs = [ catalog for catalog in repo.catalogs() ]
+        self.assertEqual(6, len(catalogs))
+        self.assertEqual(2, len(repo._opened_catalogs))
+        self.assertFalse(catalogs[0].is_open())
+        self.assertEqual("bar", catalogs[0].find_directory_entry("/bar").name)
+        self.assertTrue(catalogs[0].is_open())
+
+        entries = [ path for path, _ in repo ]
+        self.assertEqual(25, len(entries))
+        self.assertEqual(0, len(repo._opened_catalogs))
+
+
+    def test_eviction_keeps_streaming_catalogs_open(self):
+        repo = cvmfs.Repository(self.mock_repo.dir, max_open_catalogs = 2)
+        new  = repo.retrieve_root_catalog()
+        old  = repo.retrieve_catalog(new.get_predecessor().hash)
+        differences = 0
+        for difference in old.diff(new):
+            repo.retrieve_catalog_for_path('/bar/3/1')
+            self.assertTrue(old.is_open() and new.is_open())
+            differences += 1
+        self.assertTrue(differences > 0)
+        repo.retrieve_catalog_for_path('/bar/1') # limit holds again
+        self.assertTrue(len(repo._opened_catalogs) <= 2)
+        self.assertTrue(new.find_directory_entry("/bar") is not None)
+        self.assertTrue(len(repo._opened_catalogs) <= 2)
+
+
+    def _cached_catalogs(self, cache_dir):
+        return [ f for _, _, files in os.walk(os.path.join(cache_dir, 'data'))
+                   for f in files if f.endswith('C') ]
+
+
+    def test_in_memory_catalogs(self):
+        cache_dir = self.sandbox.temporary_dir
+        repo = cvmfs.Repository(self.mock_repo.dir, cache_dir,
+                                in_memory_catalogs = True)
+        catalogs = [ catalog for catalog in repo.catalogs() ]
+        self.assertEqual(6, len(catalogs))
+        self.assertTrue(all([ c.is_memory_backed() for c in catalogs ]))
+        self.assertEqual([], self._cached_catalogs(cache_dir))
+        self.assertEqual(25, len([ path for path, _ in repo ]))
+        del catalogs
+
+        repo = cvmfs.Repository(self.mock_repo.dir, cache_dir,
+                                in_memory_catalogs = True,
+                                max_in_memory_catalog_size = 1)
+        root_catalog = repo.retrieve_root_catalog()
+        self.assertFalse(root_catalog.is_memory_backed())
+        self.assertEqual(1, len(self._cached_catalogs(cache_dir)))
+
+
+    def test_parallel_walk(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        expected = dict([ (path, dirent) for path, dirent in repo ])
+        walked   = dict([ (path, dirent) for path, dirent
+                                         in repo.walk_parallel(processes = 2) ])
+        self.assertEqual(sorted(expected.keys()), sorted(walked.keys()))
+        for path, dirent in expected.iteritems():
+            self.assertEqual(dirent.path_hash(), walked[path].path_hash())
+            self.assertEqual(dirent.flags, walked[path].flags)
+        self.assertEqual(expected["/bar/big"].content_hash_string(),
+                         walked["/bar/big"].content_hash_string())
+        self.assertEqual(2, len(walked["/bar/big"].chunks))
+
+        total_size = repo.walk_parallel(processes = 2).reduce(
+                         lambda size, path, dirent: size + dirent.size
+                                                    if dirent.is_file() else size,
+                         0, lambda a, b: a + b)
+        self.assertEqual(sum([ d.size for d in expected.values() if d.is_file() ]),
+                         total_size)
+
+
+    def test_parallel_walk_batches(self):
+        repo    = cvmfs.open_repository(self.mock_repo.dir)
+        largest = max([ len(list(catalog)) for catalog in repo.catalogs() ])
+        self.assertTrue(largest > 2)
+        walker  = cvmfs.ParallelRepositoryWalker(repo, processes  = 2,
+                                                       batch_size = 2)
+        batches = list(walker._walk(None, None))
+        self.assertTrue(all([ 0 < len(batch) <= 2 for batch in batches ]))
+        self.assertTrue(len(batches) > len(list(repo.catalogs())))
+        self.assertEqual(sorted([ path for path, _ in repo ]),
+                         sorted([ path for batch in batches
+                                       for path, _ in batch ]))
+
+
+    def test_iterate_subtree(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        all_paths = [ path for path, _ in repo ]
+        self.assertEqual(sorted(all_paths),
+                         sorted([ path for path, _ in repo.iterate_subtree("/") ]))
+
+        bar3 = sorted([ path for path, _ in repo.iterate_subtree("/bar/3/") ])
+        self.assertEqual([ "/bar/3", "/bar/3/.cvmfscatalog", "/bar/3/1",
+                           "/bar/3/1/bar", "/bar/3/2", "/bar/3/2/bar",
+                           "/bar/3/3", "/bar/3/3/bar" ], bar3)
+
+        cache_dir = self.sandbox.temporary_dir
+        repo = cvmfs.Repository(self.mock_repo.dir, cache_dir)
+        bar  = sorted([ path for path, _ in repo.iterate_subtree("/bar") ])
+        self.assertEqual(sorted([ p for p in all_paths
+                                    if p.startswith("/bar") ]), bar)
+        foo_catalog = "d7d8c0a92820190ebf2ecc2ea6985b0bb1ed1a5e"
+        self.assertEqual(5, len(self._cached_catalogs(cache_dir)))
+        self.assertFalse(foo_catalog[2:] + 'C' in self._cached_catalogs(cache_dir))
+
+        hello = [ path for path, _ in repo.iterate_subtree("/bar/hello_world") ]
+        self.assertEqual([ "/bar/hello_world" ], hello)
+        self.assertRaises(cvmfs.FileNotFoundInRepository,
+                          repo.iterate_subtree, "/nonexistent")
+
+
+    def test_find_entries(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        all_entries = [ (path, dirent) for path, dirent in repo ]
+
+        big_files = cvmfs.DirectoryEntryFilter(min_size = 1024 * 1024)
+        self.assertEqual([ "/bar/big" ],
+                         [ path for path, _ in repo.find_entries(big_files) ])
+
+        directories = cvmfs.DirectoryEntryFilter(
+                                    flags = cvmfs.DirectoryEntryFilter.Directory)
+        self.assertEqual(sorted([ p for p, d in all_entries if d.is_directory() ]),
+                         sorted([ p for p, _ in repo.find_entries(directories) ]))
+
+        bars = cvmfs.DirectoryEntryFilter(name_pattern = "ba[r]")
+        self.assertEqual(sorted([ p for p, d in all_entries if d.name == "bar" ]),
+                         sorted([ p for p, _ in repo.find_entries(bars) ]))
+        self.assertEqual([ "/bar/3/1/bar", "/bar/3/2/bar", "/bar/3/3/bar" ],
+                         sorted([ p for p, _ in repo.find_entries(bars, "/bar/3") ]))
+
+        _, hello = [ e for e in all_entries if e[0] == "/bar/hello_world" ][0]
+        by_hash = cvmfs.DirectoryEntryFilter(content_hash = hello.content_hash_string())
+        self.assertTrue("/bar/hello_world" in
+                        [ path for path, _ in repo.find_entries(by_hash) ])
+
+
+    def test_walk_resumable(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        all_paths = [ path for path, _ in repo ]
+        checkpoint_path = os.path.join(self.sandbox.temporary_dir, "walk.json")
+
+        first_walk = []
+        for path, _ in repo.walk_resumable(checkpoint_path, interval = 4):
+            first_walk.append(path)
+            if len(first_walk) == 10: # simulated crash
+                break
+        self.assertTrue(os.path.exists(checkpoint_path))
+
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        resumed = [ path for path, _ in
+                    repo.walk_resumable(checkpoint_path, interval = 4) ]
+        self.assertEqual(all_paths, first_walk[:8] + resumed)
+        self.assertFalse(os.path.exists(checkpoint_path))
+
+
+    def test_walk_checkpoint_encoding(self):
+        repo     = cvmfs.open_repository(self.mock_repo.dir)
+        iterator = cvmfs.RepositoryIterator(repo)
+        iterator.next()
+        backlog  = iterator.catalog_stack[-1].catalog_iterator.backlog
+        backlog.append(("/raw\xff", None, True))
+
+        checkpoint = cvmfs.WalkCheckpoint(
+                            os.path.join(self.sandbox.temporary_dir, "walk.json"),
+                            repo.manifest.root_catalog)
+        checkpoint.save(iterator.get_cursor())
+        cursor = checkpoint.load()
+        paths  = [ path.encode(cursor['path_encoding'])
+                   for _, catalog_backlog in cursor['catalogs']
+                   for path, _ in catalog_backlog ]
+        self.assertEqual("/raw\xff", paths[-1])
+        self.assertEqual("/raw\xff",
+                         cvmfs.RepositoryIterator._to_str(u"/raw\xff", "latin-1"))
+
+
+    def test_path_index(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        all_paths  = [ path for path, _ in repo ]
+        index_path = os.path.join(self.sandbox.temporary_dir, "paths.db")
+
+        path_index = cvmfs.PathIndex(index_path)
+        previous_root = repo.retrieve_root_catalog().get_predecessor().hash
+        self.assertEqual(2, path_index.index_revision(repo, previous_root))
+        self.assertEqual(5, path_index.index_revision(repo,
+                                                      repo.manifest.root_catalog))
+        self.assertEqual(0, path_index.index_revision(repo, previous_root))
+        path_index.close()
+
+        self.assertEqual(sorted([ p for p in all_paths if "ar/3/" in p ]),
+                         sorted(repo.search_paths("ar/3/", index_path)))
+        self.assertEqual(sorted([ p for p in all_paths if p.endswith("/bar") ]),
+                         sorted(repo.glob_paths("*/bar", index_path)))
+        self.assertEqual([], repo.search_paths("*", index_path))
+
+
+    def test_content_index(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        entries    = dict([ (path, dirent) for path, dirent in repo ])
+        index_path = os.path.join(self.sandbox.temporary_dir, "contents.db")
+
+        content_index = cvmfs.ContentIndex(index_path)
+        previous_root = repo.retrieve_root_catalog().get_predecessor().hash
+        self.assertEqual(2, content_index.index_revision(repo, previous_root))
+        self.assertEqual(5, content_index.index_revision(repo,
+                                                         repo.manifest.root_catalog))
+        content_index.close()
+
+        hello_hash = entries["/bar/hello_world"].content_hash_string()
+        chunk_hash = entries["/bar/big"].chunks[1].content_hash_string()
+        unknown    = "0" * 40
+        paths = repo.find_paths_by_content([ hello_hash, chunk_hash, unknown ],
+                                           index_path)
+        self.assertEqual(sorted([ p for p, d in entries.iteritems()
+                                    if d.content_hash and
+                                       d.content_hash_string() == hello_hash ]),
+                         paths[hello_hash])
+        self.assertEqual([ "/bar/big" ], paths[chunk_hash])
+        self.assertEqual([], paths[unknown])
+
+
+    def test_analyze_deduplication(self):
+        repo    = cvmfs.open_repository(self.mock_repo.dir)
+        objects = []
+        for _, dirent in repo:
+            if dirent.is_chunked_file():
+                objects.extend([ (c.content_hash_string(), c.size)
+                                 for c in dirent.chunks ])
+            elif dirent.is_file():
+                objects.append((dirent.content_hash_string(), dirent.size))
+        unique = dict(objects)
+
+        report = repo.analyze_deduplication(top_n = 1)
+        self.assertEqual(len(objects), report.logical_objects)
+        self.assertEqual(sum([ size for _, size in objects ]), report.logical_size)
+        self.assertEqual(len(unique), report.unique_objects)
+        self.assertEqual(sum(unique.values()), report.unique_size)
+        self.assertEqual(1, len(report.top_duplicates))
+        top = report.top_duplicates[0]
+        self.assertEqual(len([ o for o in objects if o[0] == top.content_hash ]),
+                         top.references)
+
+
+    def test_audit_garbage(self):
+        repo   = cvmfs.open_repository(self.mock_repo.dir)
+        report = repo.audit_garbage(list_objects = True)
+        self.assertEqual(3, len(report.root_catalogs))
+        self.assertEqual(report.scanned_objects,
+                         report.reachable_objects + report.unreferenced_objects)
+        self.assertEqual([ "data/40/031403234c6113e6076f66873b7ffb56bf0b35H",
+                           "data/8a/68a34dcebcd087d773c9ff568fe8a253f26b5bH",
+                           "data/ad/58b4c8fb10edd0f580404642f6fc9956ee5f40C" ],
+                         sorted(report.unreferenced))
+        size = sum([ os.path.getsize(os.path.join(self.mock_repo.dir, path))
+                     for path in report.unreferenced ])
+        self.assertEqual(size, report.unreferenced_size)
+
+        untagged = repo.audit_garbage(include_tags = False, list_objects = True)
+        self.assertTrue("data/d4/34d4bd22549f7c4e6fa4d91862039d04aca2feC"
+                        in untagged.unreferenced)
+        self.assertFalse("data/28/a5cda91ab58cad89f41b33881985ec3dbc13f4C"
+                         in untagged.unreferenced)
+
+
+    def test_replication(self):
+        repo       = cvmfs.open_repository(self.mock_repo.dir)
+        target_dir = os.path.join(self.sandbox.temporary_dir, "stratum1")
+        work_dir   = os.path.join(self.sandbox.temporary_dir, "work")
+        os.mkdir(work_dir)
+        replicator = cvmfs.Replicator(repo, target_dir, 4, work_dir)
+        self.assertEqual(repo.manifest.root_catalog, replicator.replicate())
+        self.assertEqual(6, replicator.compared_catalogs)
+        self.assertTrue(replicator.downloaded_objects > 0)
+        for name in [ ".cvmfspublished", ".cvmfswhitelist" ]:
+            self.assertEqual(open(os.path.join(self.mock_repo.dir, name)).read(),
+                             open(os.path.join(target_dir, name)).read())
+        self.assertFalse(os.path.exists(os.path.join(target_dir,
+                                                     ".cvmfs_is_snapshotting")))
+
+        replica = cvmfs.open_repository(target_dir)
+        self.assertEqual("stratum1", replica.type)
+        for path, dirent in replica:
+            if dirent.is_chunked_file():
+                for chunk in dirent.chunks:
+                    replica.retrieve_object(chunk.content_hash_string(), 'P')
+            elif dirent.is_file():
+                dirent.retrieve_from(replica)
+        self.assertEqual(len([ e for e in repo ]), len([ e for e in replica ]))
+
+        replicator.replicate() # steady state: nothing changed
+        self.assertEqual(0, replicator.compared_catalogs)
+        self.assertEqual(0, replicator.downloaded_objects)
+        self.assertEqual([], os.listdir(work_dir)) # caches are cleaned up
+
+
+    def test_replication_uses_a_single_manifest(self):
+        repo       = cvmfs.open_repository(self.mock_repo.dir)
+        target_dir = os.path.join(self.sandbox.temporary_dir, "stratum1")
+        root_hash  = repo.manifest.root_catalog
+        repo.manifest.root_catalog = "f" * 40 # outdated in-memory manifest
+        replicator = cvmfs.Replicator(repo, target_dir)
+        self.assertEqual(root_hash, replicator.replicate())
+        replica    = cvmfs.open_repository(target_dir)
+        self.assertEqual(root_hash, replica.manifest.root_catalog)
+        self.assertEqual(25, len([ e for e in replica ]))
+
+
+    def test_multi_revision_walker(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        def count_entries(catalog):
+            return catalog.run_sql("SELECT count(*) FROM catalog;")[0][0]
+        walker   = cvmfs.MultiRevisionWalker(repo, count_entries,
+                                             lambda a, b: a + b, 0)
+        revisions = list(walker.walk_history())
+        self.assertEqual(4, len(revisions))
+        self.assertEqual(repo.manifest.root_catalog, revisions[0][0])
+
+        distinct = set()
+        for root_hash, num_entries in revisions:
+            catalogs = walker.revision_catalogs(root_hash)
+            distinct.update(catalogs)
+            self.assertEqual(sum([ count_entries(repo.retrieve_catalog(c))
+                                   for c in catalogs ]), num_entries)
+        self.assertEqual(len(distinct), walker.opened_catalogs)
+        self.assertTrue(walker.opened_catalogs < sum([ len(walker.revision_catalogs(r))
+                                                       for r, _ in revisions ]))
+
+        tagged = list(walker.walk_tags())
+        self.assertEqual(3, len(tagged))
+        self.assertEqual(len(distinct), walker.opened_catalogs)
+
+
+    def test_history_queries(self):
+        repo    = cvmfs.open_repository(self.mock_repo.dir)
+        history = repo.retrieve_history()
+        self.assertEqual(5, len(history.list_tags()))
+        self.assertEqual("d434d4bd22549f7c4e6fa4d91862039d04aca2fe",
+                         history.get_tag_by_name("trunk-previous").hash)
+        self.assertEqual(None, history.get_tag_by_name("nonexistent"))
+        self.assertEqual([ "generic-2015-06-11T13:29:49Z", "trunk" ],
+                         sorted([ t.name for t in history.find_tags_by_revision(3) ]))
+        self.assertEqual(5, len(list(history.find_tags_by_channel(0))))
+        self.assertEqual([], list(history.find_tags_by_channel(1)))
+
+        oldest = history.get_tag_by_name("generic-2015-06-11T13:29:15Z")
+        newer  = list(history.find_tags_in_time_range(start = oldest.timestamp))
+        self.assertEqual(5, len(newer))
+        older  = list(history.find_tags_in_time_range(end = oldest.timestamp))
+        self.assertEqual([], older)
+        self.assertEqual(3, history.get_latest_tags_per_channel()[0].revision)
+
+        catalog = repo.retrieve_tag_root_catalog("trunk-previous")
+        self.assertEqual("d434d4bd22549f7c4e6fa4d91862039d04aca2fe", catalog.hash)
+        self.assertEqual(oldest.hash, repo.retrieve_tag_root_catalog(oldest).hash)
+        self.assertRaises(cvmfs.TagNotFound,
+                          repo.retrieve_tag_root_catalog, "nonexistent")
+
+
+    def test_history_aware_timestamps(self):
+        repo    = cvmfs.open_repository(self.mock_repo.dir)
+        history = repo.retrieve_history()
+        oldest  = history.get_tag_by_name("generic-2015-06-11T13:29:15Z")
+        created = datetime.datetime.fromtimestamp(oldest._unix_timestamp, tzutc())
+        old_tz  = os.environ.get('TZ')
+        os.environ['TZ'] = 'Europe/Zurich'
+        time.tzset()
+        try:
+            self.assertEqual(oldest._unix_timestamp,
+                             cvmfs._common._to_unix_timestamp(created))
+            self.assertEqual(oldest.name, history.get_tag_at(created).name)
+            self.assertEqual(5, len(list(
+                             history.find_tags_in_time_range(start = created))))
+        finally:
+            if old_tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = old_tz
+            time.tzset()
+
+
+    def test_open_revision(self):
+        repo = cvmfs.open_repository(self.mock_repo.dir)
+        view = repo.open_revision(tag = "trunk-previous")
+        self.assertEqual("d434d4bd22549f7c4e6fa4d91862039d04aca2fe",
+                         view.manifest.root_catalog)
+        self.assertEqual(2, view.manifest.revision)
+        self.assertEqual(repo.manifest.root_catalog, repo.retrieve_root_catalog().hash)
+        self.assertEqual(view.manifest.root_catalog,
+                         view.retrieve_root_catalog().hash)
+        self.assertEqual([ "/", "/foo" ],
+                         sorted([ c.root_prefix for c in view.catalogs() ]))
+        self.assertTrue(view.find_directory_entries([ "/bar/1" ])[0] is not None)
+        self.assertEqual("/", view.retrieve_catalog_for_path("/bar/1").root_prefix)
+        self.assertEqual("/bar/1", repo.retrieve_catalog_for_path("/bar/1").root_prefix)
+        self.assertTrue(len([ e for e in view ]) < len([ e for e in repo ]))
+
+        self.assertEqual(view.manifest.root_catalog,
+                         repo.open_revision(revision = 2).manifest.root_catalog)
+        self.assertEqual("ad58b4c8fb10edd0f580404642f6fc9956ee5f40",
+                         repo.open_revision(revision = 0).manifest.root_catalog)
+        tagged = repo.open_revision(tag = "trunk-previous").tag
+        by_time = repo.open_revision(timestamp = tagged.timestamp)
+        self.assertEqual(2, by_time.manifest.revision)
+        self.assertRaises(cvmfs.TagNotFound, repo.open_revision, tag = "nonexistent")
+        self.assertRaises(cvmfs.TagNotFound, repo.open_revision, timestamp = 0)
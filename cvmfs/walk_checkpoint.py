@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created by René Meusel
+This file is part of the CernVM File System auxiliary tools.
+"""
+
+import json
+import os
+import tempfile
+
+
+class WalkCheckpoint:
+    """ Persists the cursor of a RepositoryIterator to resume long walks
+
+    A checkpoint is bound to the root catalog hash of the walked revision.
+    Checkpoints of a different revision are ignored when loading.
+    """
+
+    def __init__(self, checkpoint_path, root_catalog_hash):
+        self.checkpoint_path = checkpoint_path
+        self.root_catalog    = root_catalog_hash
+
+    def __str__(self):
+        return "<WalkCheckpoint " + self.checkpoint_path + ">"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+    def load(self):
+        """ Returns the persisted cursor or None if there is no usable one """
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                cursor = json.load(checkpoint_file)
+        except (IOError, ValueError), e:
+            return None
+        if cursor.get('root_catalog') != self.root_catalog:
+            return None
+        return cursor
+
+
+    def save(self, cursor):
+        """ Atomically replaces the checkpoint with the given cursor """
+        checkpoint_dir = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        fd, tmp_path = tempfile.mkstemp(dir=checkpoint_dir, prefix='tmp.')
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(cursor, tmp_file)
+        os.rename(tmp_path, self.checkpoint_path)
+
+
+    def remove(self):
+        if os.path.exists(self.checkpoint_path):
+            os.unlink(self.checkpoint_path)